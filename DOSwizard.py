@@ -7,6 +7,7 @@ from PyQt5 import QtCore
 import pyqtgraph as pg
 from pyqtgraph.parametertree import Parameter, ParameterTree
 from VASPparser import *
+from merged_dos import merge_pdos
 
 pg.setConfigOptions(antialias=True)
 
@@ -203,9 +204,9 @@ class MainWindow(QMainWindow):
     def plot_merged(self):
         print("merging...")
         self.clear_plots()
-        self.merged_data_up = [sum(elements) for elements in zip(*[list[0] for list in self.plot_data_list_up])]
-        self.merged_data_down = [sum(elements) for elements in zip(*[list[0] for list in self.plot_data_list_down])]
-        self.plot_tab1_right.addItem(pg.PlotDataItem([-x for x in self.merged_data_down], self.data.doscar.total_dos_energy, pen=pg.mkPen('r')))
+        self.merged_data_up, self.merged_data_down = merge_pdos(self.data.doscar.dos, self.selected_atoms,
+                                                                self.selected_orbitals)
+        self.plot_tab1_right.addItem(pg.PlotDataItem(-self.merged_data_down, self.data.doscar.total_dos_energy, pen=pg.mkPen('r')))
 
         self.plot_tab1.addItem(
             pg.PlotDataItem(self.merged_data_up, self.data.doscar.total_dos_energy, pen=pg.mkPen('r')))
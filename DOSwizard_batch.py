@@ -0,0 +1,144 @@
+"""headless PDOS extraction over a tree of VASP calculations
+
+every directory holding a DOSCAR and a POSCAR is parsed in a worker process
+and the requested projections are written to one columnar file:
+
+    python DOSwizard_batch.py runs/ -s Pt:d -s O:p -s 1-4,9:all -o pdos.npz
+
+a selection is TARGET:ORBITALS, TARGET being an element symbol, 1-based atom
+numbers / ranges or 'all', ORBITALS a shell (s, p, d, f), an orbital name
+(e.g. dz) or 'all'. the selected atoms and orbitals are summed. columns are
+run, projection, energy, e_minus_ef, up and down, one row per energy point;
+down is NaN for runs without spin polarisation (ISPIN=1). no Qt is imported
+on this path
+"""
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import numpy as np
+from VASPparser import VaspData
+from merged_dos import merge_sum
+from band_moments import shell_groups
+
+COLUMNS = ('run', 'projection', 'energy', 'e_minus_ef', 'up', 'down')
+
+
+def find_runs(roots):
+    """directories below ``roots`` that contain both DOSCAR and POSCAR, sorted"""
+    runs = []
+    for root in roots:
+        for directory, _, files in os.walk(root):
+            if 'DOSCAR' in files and 'POSCAR' in files:
+                runs.append(directory)
+    return sorted(runs)
+
+
+def parse_selection(selection):
+    target, _, orbitals = selection.partition(':')
+    return target.strip(), (orbitals.strip() or 'all')
+
+
+def select_atoms(target, symbols):
+    """atom indices for an element symbol, 'all' or 1-based numbers like '1-4,9'"""
+    symbols = np.asarray(symbols)
+    if target == 'all':
+        return np.arange(len(symbols))
+    if target in symbols:
+        return np.flatnonzero(symbols == target)
+    atoms = []
+    try:
+        for part in target.split(','):
+            first, _, last = part.partition('-')
+            atoms.extend(range(int(first), int(last or first) + 1))
+    except ValueError:
+        raise ValueError(f'no element or atom range {target!r} (elements: {" ".join(np.unique(symbols))})')
+    atoms = np.array(atoms, dtype=int) - 1
+    if atoms.min() < 0 or atoms.max() >= len(symbols):
+        raise ValueError(f'atoms {target} out of range 1-{len(symbols)}')
+    return atoms
+
+
+def select_orbitals(group, orbitals, orbital_types):
+    """orbital indices for a shell letter, an orbital name or 'all'"""
+    if group == 'all':
+        return np.arange(len(orbitals))
+    shells = dict(shell_groups(orbitals, orbital_types))
+    if group in shells:
+        return np.array(shells[group], dtype=int)
+    if group in orbitals:
+        return np.array([orbitals.index(group)], dtype=int)
+    raise ValueError(f'no orbital group {group!r} (available: {" ".join(list(shells) + orbitals)})')
+
+
+def extract(directory, selections, cache=False):
+    """columns of the summed projections of one run, see COLUMNS"""
+    data = VaspData(directory, cache=cache)
+    energy = np.asarray(data.doscar.total_dos_energy, dtype=float)
+    columns = {name: [] for name in COLUMNS}
+    for selection in selections:
+        target, group = parse_selection(selection)
+        atoms = select_atoms(target, data.list_atomic_symbols)
+        orbitals = select_orbitals(group, data.orbitals, data.orbital_types)
+        total = merge_sum(data.doscar.dos, atoms, orbitals)
+        up, down = total[0], total[1] if len(total) > 1 else np.full(len(energy), np.nan)
+        columns['run'].append(np.full(len(energy), directory))
+        columns['projection'].append(np.full(len(energy), selection))
+        columns['energy'].append(energy)
+        columns['e_minus_ef'].append(energy - data.e_fermi)
+        columns['up'].append(up)
+        columns['down'].append(down)
+    return {name: np.concatenate(values) for name, values in columns.items()}
+
+
+def write_output(filename, columns):
+    """one array per column in .npz, or a .csv with a header line"""
+    if filename.endswith('.csv'):
+        table = np.rec.fromarrays([columns[name] for name in COLUMNS], names=COLUMNS)
+        np.savetxt(filename, table, fmt=['%s', '%s', '%.6f', '%.6f', '%.6e', '%.6e'], delimiter=',',
+                   header=','.join(COLUMNS), comments='')
+    else:
+        np.savez_compressed(filename, **columns)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='extract projected DOS from many VASP runs')
+    parser.add_argument('roots', nargs='+', help='directories searched for DOSCAR + POSCAR')
+    parser.add_argument('-s', '--select', action='append', required=True,
+                        help='TARGET:ORBITALS, e.g. Pt:d, O:p, 1-4,9:dz or all:all; may be repeated')
+    parser.add_argument('-o', '--output', default='pdos.npz', help='.npz or .csv file (default pdos.npz)')
+    parser.add_argument('-j', '--workers', type=int, default=os.cpu_count(), help='worker processes')
+    parser.add_argument('--cache', action='store_true', help='use and write DOSCAR.cache next to every DOSCAR')
+    args = parser.parse_args(argv)
+
+    runs = find_runs(args.roots)
+    if not runs:
+        parser.error('no directory with DOSCAR and POSCAR found')
+    print(f'{len(runs)} runs, {args.workers} workers')
+    start = time.perf_counter()
+    results = {}
+    failed = 0
+    with ProcessPoolExecutor(args.workers) as pool:
+        futures = {pool.submit(extract, run, args.select, args.cache): run for run in runs}
+        for done, future in enumerate(as_completed(futures), 1):
+            run = futures[future]
+            try:
+                results[run] = future.result()
+            except Exception as error:
+                failed += 1
+                print(f'\r{run}: {error}', file=sys.stderr)
+            print(f'\r{done}/{len(runs)}', end='', flush=True)
+    print()
+    if not results:
+        print('nothing extracted', file=sys.stderr)
+        return 1
+    columns = {name: np.concatenate([results[run][name] for run in sorted(results)]) for name in COLUMNS}
+    write_output(args.output, columns)
+    print(f'{len(results)} runs written to {args.output} in {time.perf_counter() - start:.1f} s'
+          + (f', {failed} failed' if failed else ''))
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
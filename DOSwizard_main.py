@@ -1,32 +1,65 @@
+import functools
+import os
 import sys
 import numpy as np
 from PyQt5.QtWidgets import (QApplication, QMainWindow, QWidget, QVBoxLayout, QHBoxLayout, QCheckBox, QLabel,
-                             QScrollArea, QFrame, QTabWidget, QSplitter,QPlainTextEdit, QPushButton, QGridLayout)
+                             QScrollArea, QFrame, QTabWidget, QSplitter,QPlainTextEdit, QPushButton, QGridLayout,
+                             QFileDialog, QListView, QTableView)
 from PyQt5 import QtCore
 import pyqtgraph as pg
-from pyqtgraph.parametertree import Parameter, ParameterTree
-from VASPparser import *
+from VASPparser import LazyAtomBlocks, VaspData
+from merged_dos import SelectionAccumulator
+from dos_render import SPIN_SIGNS, RedrawScheduler, SharedCurveItem, add_shared, group_by_color, mirror_spins
+from data_loader import DataLoader
+from atom_list import AtomListModel
+from broadening import KERNELS, Broadener
+from band_moments import band_table, shell_groups
+from record_table import RecordTableModel
+from instrumentation import TRACE, held_bytes, timed
+from trace_panel import TracePanel
+import dos_export
 import platform
 
 
 pg.setConfigOptions(antialias=True)
 
-class VaspData():
-    def __init__(self, dir):
-        self.doscar = DOSCARparser(os.path.join(dir, "DOSCAR"))
-        self.data_up = self.doscar.dataset_up
-        self.data_down = self.doscar.dataset_down
-        self.orbitals = self.doscar.orbitals
-        self.orbital_types = self.doscar.orbital_types
-        self.e_fermi = self.doscar.efermi
-        self.total_alfa = self.doscar.total_dos_alfa
-        self.total_beta = self.doscar.total_dos_beta
 
-        poscar = PoscarParser(os.path.join(dir, "POSCAR"))
-        self.atoms_symb_and_num = poscar.symbol_and_number()
-        self.number_of_atoms = poscar.number_of_atoms()
-        self.list_atomic_symbols = poscar.list_atomic_symbols()
-        self.atomic_symbols = poscar.atomic_symbols()
+# DOSCARs larger than this are only indexed, atoms are decoded when first used
+LAZY_DOSCAR_SIZE = 256 * 2 ** 20
+
+
+def load_data(path, progress=None, lazy=None):
+    """VaspData of a calculation directory or of an HDF5 / Parquet export;
+    lazy=None reads the DOSCAR lazily (see LazyAtomBlocks) above LAZY_DOSCAR_SIZE"""
+    if dos_export.is_export(path):
+        return dos_export.load(path)
+    if lazy is None:
+        doscar = os.path.join(path, "DOSCAR")
+        lazy = os.path.exists(doscar) and os.path.getsize(doscar) > LAZY_DOSCAR_SIZE
+    return VaspData(path, lazy=lazy, progress=progress)
+
+
+def fill_cache(data, progress=None):
+    """write the DOSCAR cache of a lazily read run, so it opens memory-mapped next time"""
+    if isinstance(data.doscar.dos, LazyAtomBlocks):
+        data.doscar.fill_cache(progress)
+
+
+class LazyTab(QWidget):
+    """tab page whose content is only built by ``factory`` when it is first shown"""
+
+    def __init__(self, factory):
+        super().__init__()
+        self.factory = factory
+        self.content = None
+        self.layout = QVBoxLayout(self)
+        self.layout.setContentsMargins(0, 0, 0, 0)
+
+    def showEvent(self, event):
+        if self.content is None:
+            self.content = self.factory()
+            self.layout.addWidget(self.content)
+        super().showEvent(event)
 
 
 class PlotWidget(QWidget):
@@ -46,17 +79,45 @@ class PlotWidget(QWidget):
 
 
 class MainWindow(QMainWindow):
-    def __init__(self):
+    def __init__(self, directory=None):
         super().__init__()
-        self.create_data()
+        self.merged_mode = False
+        self.merged_curve = None
+        self.data = None
+        self.loader = None
+        self.loaders = []
         self.initUI()
         self.orb_types = [["s"], ["py", "pz", "px"], ["dxy", "dyz", "dz", "dxz", "dx2y2"],
                           ["fy(3x2-y2)", "fxyz", "fyz2", "fz3", "fxz2", "fz(x2-y2)", "fx(x2-3y2)"]]
+        # the window shows up right away, DOSCAR and POSCAR are parsed in the background
+        self.start_loading(directory or self.default_directory())
 
     def initUI(self):
         self.setWindowTitle('DOSWave v.0.0.0')
         self.resize(1200, 800)
 
+        file_menu = self.menuBar().addMenu("File")
+        open_action = file_menu.addAction("Open directory...")
+        open_action.triggered.connect(self.open_directory)
+        open_export_action = file_menu.addAction("Open exported DOS...")
+        open_export_action.triggered.connect(self.open_export)
+        self.export_action = file_menu.addAction("Export DOS...")
+        self.export_action.triggered.connect(self.export_dos)
+        self.export_action.setEnabled(False)
+        file_menu.addSeparator()
+        self.lazy_action = file_menu.addAction("Decode atoms on demand")
+        self.lazy_action.setCheckable(True)
+        self.lazy_action.setToolTip(f"always read DOSCARs lazily, not only above "
+                                    f"{LAZY_DOSCAR_SIZE // 2 ** 20} MB; applies to the next open")
+
+        # timings of parsing, summation and drawing, see instrumentation.TRACE
+        self.trace_panel = TracePanel(self)
+        self.trace_panel.message.connect(self.print_to_console)
+        self.addDockWidget(QtCore.Qt.BottomDockWidgetArea, self.trace_panel)
+        self.trace_panel.hide()
+        view_menu = self.menuBar().addMenu("View")
+        view_menu.addAction(self.trace_panel.toggleViewAction())
+
         central_widget = QWidget()
         self.setCentralWidget(central_widget)
         main_layout = QVBoxLayout(central_widget)
@@ -70,8 +131,8 @@ class MainWindow(QMainWindow):
         self.plot_tab1 = QWidget()
         self.plot_tab1_layout = QVBoxLayout(self.plot_tab1)  # Change to QVBoxLayout to accommodate the splitter
         left_tab_widget.addTab(self.plot_tab1, "DOS")
-        left_tab_widget.addTab(PlotWidget(), "Structure")
-        left_tab_widget.addTab(PlotWidget(), "PARCHG/CHGCAR")
+        left_tab_widget.addTab(LazyTab(PlotWidget), "Structure")
+        left_tab_widget.addTab(LazyTab(PlotWidget), "PARCHG/CHGCAR")
         splitter.addWidget(left_tab_widget)
 
         # Create QSplitter to hold the full range plot and the bounded plot
@@ -91,60 +152,61 @@ class MainWindow(QMainWindow):
         # Add LinearRegionItem to the full range plot
         self.region = pg.LinearRegionItem(orientation=pg.LinearRegionItem.Horizontal, brush=pg.mkBrush(255,235,14,100))
         self.full_range_plot.addItem(self.region)
-        self.region.sigRegionChanged.connect(self.update_bounded_plot_y_range)
+        # redraws and region <-> range syncs are coalesced to one per frame
+        self.syncing_range = False
+        self.plot_scheduler = RedrawScheduler(self.refresh_plot, parent=self)
+        self.region_scheduler = RedrawScheduler(self.update_bounded_plot_y_range, parent=self)
+        self.range_scheduler = RedrawScheduler(self.update_region_from_bounded_plot, parent=self)
+        self.region.sigRegionChanged.connect(self.region_changed)
 
         # Connect view range change of the bounded plot to update the LinearRegion
-        self.bounded_plot.sigRangeChanged.connect(self.update_region_from_bounded_plot)
+        # only the energy (y) range matters, x auto-ranging must not move the region
+        self.bounded_plot.getViewBox().sigYRangeChanged.connect(self.bounded_range_changed)
 
         # Set an initial region to make sure it's visible
         self.region.setRegion([-5,5])
 
-        # Add InfiniteLine at y=0.5 to both plots
-        self.inf_line_full = pg.InfiniteLine(pos=float(self.data.doscar.efermi), angle=0, pen=pg.mkPen('b'), movable=False, label='E_Fermi={value:0.2f}',labelOpts={'position': 0.1, 'color': (0, 0, 255), 'fill': (0, 0, 255, 100),'movable': True})
-        self.inf_line_bounded = pg.InfiniteLine(pos=float(self.data.doscar.efermi), angle=0, pen=pg.mkPen('b'), movable=False, label='E_Fermi={value:0.2f}',labelOpts={'position': 0.1, 'color': (0, 0, 255), 'fill': (0, 0, 255, 100),'movable': True})
+        # Add InfiniteLine at the Fermi energy to both plots, shown once data is loaded
+        self.inf_line_full = pg.InfiniteLine(pos=0.0, angle=0, pen=pg.mkPen('b'), movable=False, label='E_Fermi={value:0.2f}',labelOpts={'position': 0.1, 'color': (0, 0, 255), 'fill': (0, 0, 255, 100),'movable': True})
+        self.inf_line_bounded = pg.InfiniteLine(pos=0.0, angle=0, pen=pg.mkPen('b'), movable=False, label='E_Fermi={value:0.2f}',labelOpts={'position': 0.1, 'color': (0, 0, 255), 'fill': (0, 0, 255, 100),'movable': True})
 
         self.full_range_plot.addItem(self.inf_line_full)
         self.bounded_plot.addItem(self.inf_line_bounded)
+        self.inf_line_full.hide()
+        self.inf_line_bounded.hide()
         splitter.setStretchFactor(0, 3)
         splitter.setStretchFactor(1,3)
 
         # Right tabs for GUI
         right_tab_widget = QTabWidget()
         param_tree_widget = QWidget()
-        param_tree_layout = QVBoxLayout(param_tree_widget)
-
-        self.param = Parameter.create(name='params', type='group', children=[
-            {'name': 'Middle Index', 'type': 'int', 'value': 0, 'limits': (0, 15)}
-        ])
-        self.param_tree = ParameterTree()
-        self.param_tree.setParameters(self.param, showTop=True)
-        self.param.sigTreeStateChanged.connect(self.parameter_changed)
-        param_tree_layout.addWidget(self.param_tree)
+        self.param_tree_layout = QVBoxLayout(param_tree_widget)
+        # the parameter tree (and the import of pyqtgraph.parametertree) waits
+        # until the window is on screen; the parameters only matter once data is loaded
+        self.param = None
+        QtCore.QTimer.singleShot(0, self.build_parameters)
 
         ######################################################## tab 2 - orbital selector ###########################
         # Create QHBoxLayout for checkboxes
         self.scroll_area_widget = QWidget()
         self.scroll_area_layout = QHBoxLayout(self.scroll_area_widget)
 
-        # Left side of the scroll area for atoms
+        # Left side for atoms: a list view only draws the visible rows, the
+        # selection itself is the boolean mask of atom_model
         self.checkboxes_widget = QWidget()
         self.checkboxes_layout = QVBoxLayout(self.checkboxes_widget)
-        self.checkboxes_layout.setAlignment(QtCore.Qt.AlignTop)
-        self.scroll_area_left = QScrollArea()  # New scroll area for checkboxes
-        self.scroll_area_left.setWidgetResizable(True)
-        self.scroll_area_left.setWidget(self.checkboxes_widget)
-        self.scroll_area_left.setFrameShape(QFrame.NoFrame)
-        self.scroll_area_layout.addWidget(self.scroll_area_left)
+        self.scroll_area_layout.addWidget(self.checkboxes_widget)
 
         label = QLabel("atoms:")
         self.checkboxes_layout.addWidget(label)
 
-        self.atom_checkboxes = []
-        for i in range(self.number_of_atoms):
-            checkbox = QCheckBox(self.atoms_symb_and_num[i])
-            checkbox.stateChanged.connect(self.checkbox_changed)
-            self.atom_checkboxes.append(checkbox)
-            self.checkboxes_layout.addWidget(checkbox)
+        self.atom_model = AtomListModel(parent=self)
+        self.atom_model.selection_changed.connect(self.checkbox_changed)
+        self.atom_list = QListView()
+        self.atom_list.setUniformItemSizes(True)
+        self.atom_list.setFrameShape(QFrame.NoFrame)
+        self.atom_list.setModel(self.atom_model)
+        self.checkboxes_layout.addWidget(self.atom_list)
 
         # Right side for orbitals
         self.scroll_right_widget = QWidget()
@@ -160,13 +222,8 @@ class MainWindow(QMainWindow):
         self.scroll_right_layout.addWidget(label)
 
         self.orbital_checkboxes = []
-        for i in range(len(self.orbitals)):
-            checkbox = QCheckBox(self.orbitals[i])
-            checkbox.stateChanged.connect(self.checkbox_changed)
-            self.orbital_checkboxes.append(checkbox)
-            self.scroll_right_layout.addWidget(checkbox)
 
-        param_tree_layout.addWidget(self.scroll_area_widget)
+        self.param_tree_layout.addWidget(self.scroll_area_widget)
 
         all_btn_layout = QVBoxLayout()
         btn_orb_layout = QHBoxLayout()
@@ -174,61 +231,16 @@ class MainWindow(QMainWindow):
         all_btn_layout.addLayout(btn_orb_layout)
         all_btn_layout.addLayout(btn_atoms_layout)
 
-        ####################### Select ORBITALS buttons#################################################
-        select_layout = QVBoxLayout()
-        for i, orbital_list in enumerate(self.orbital_types):
-            orb_letter = orbital_list[0] if len(orbital_list) == 1 else orbital_list[0][0]
-            btn = QPushButton(f"select {orb_letter}", self)
-            btn.clicked.connect(lambda _, x=i: self.select_orbital(x))
-            select_layout.addWidget(btn)
-
-        select_all_btn = QPushButton("select all", self)
-        select_all_btn.clicked.connect(self.select_all_orbitals)
-        select_layout.addWidget(select_all_btn)
-
-        btn_orb_layout.addLayout(select_layout)
+        # select / deselect buttons depend on the loaded data, see populate_data_widgets
+        self.select_orbital_layout = QVBoxLayout()
+        self.deselect_orbital_layout = QVBoxLayout()
+        btn_orb_layout.addLayout(self.select_orbital_layout)
+        btn_orb_layout.addLayout(self.deselect_orbital_layout)
 
-        # Deselect buttons
-        deselect_layout = QVBoxLayout()
-        for i, orbital_list in enumerate(self.orbital_types):
-            orb_letter = orbital_list[0] if len(orbital_list) == 1 else orbital_list[0][0]
-            btn = QPushButton(f"deselect {orb_letter}", self)
-            btn.clicked.connect(lambda _, x=i: self.deselect_orbital(x))
-            deselect_layout.addWidget(btn)
-
-        deselect_all_btn = QPushButton("Deselect all", self)
-        deselect_all_btn.clicked.connect(self.deselect_all_orbitals)
-        deselect_layout.addWidget(deselect_all_btn)
-
-        btn_orb_layout.addLayout(deselect_layout)
-
-        ############################################ ATOMS ##########################################
-        select_atom_layout = QVBoxLayout()
-        deselect_atom_layout = QVBoxLayout()
-
-        for i, atom_list in enumerate(self.atomic_symbols):
-            atom_letter = atom_list
-            btn = QPushButton(f"select {atom_letter}", self)
-            btn.clicked.connect(lambda _, x=i: self.select_atom(x))
-            select_atom_layout.addWidget(btn)
-
-        select_all_atoms_btn = QPushButton("Select all", self)
-        select_all_atoms_btn.clicked.connect(self.select_all_atoms)
-        select_atom_layout.addWidget(select_all_atoms_btn)
-
-        for i, atom_list in enumerate(self.atomic_symbols):
-            atom_letter = atom_list
-            btn = QPushButton(f"Deselect {atom_letter}", self)
-            btn.clicked.connect(lambda _, x=i: self.deselect_atom(x))
-            deselect_atom_layout.addWidget(btn)
-
-        deselect_all_atoms_btn = QPushButton("Deselect all", self)
-        deselect_all_atoms_btn.clicked.connect(self.deselect_all_atoms)
-        deselect_atom_layout.addWidget(deselect_all_atoms_btn)
-
-
-        btn_atoms_layout.addLayout(select_atom_layout)
-        btn_atoms_layout.addLayout(deselect_atom_layout)
+        self.select_atom_layout = QVBoxLayout()
+        self.deselect_atom_layout = QVBoxLayout()
+        btn_atoms_layout.addLayout(self.select_atom_layout)
+        btn_atoms_layout.addLayout(self.deselect_atom_layout)
         self.scroll_area_layout.addLayout(all_btn_layout)
         ########################################## additional buttons ##################################################
         self.additional_button_layout  = QGridLayout()
@@ -245,6 +257,8 @@ class MainWindow(QMainWindow):
         self.plot_total_dos_btn = QPushButton("total DOS")
         self.additional_button_layout.addWidget(self.plot_total_dos_btn, 1, 0)
         self.plot_total_dos_btn.clicked.connect(self.plot_total_dos)
+        self.plot_merged_btn.setEnabled(False)
+        self.plot_total_dos_btn.setEnabled(False)
         
 
 
@@ -254,9 +268,26 @@ class MainWindow(QMainWindow):
         ###################################### tab 3 - atom selection ##################################################
         empty_widget = QWidget()  # An empty tab
 
+        ###################################### tab 4 - band moments ####################################################
+        moments_widget = QWidget()
+        moments_layout = QVBoxLayout(moments_widget)
+        self.compute_moments_btn = QPushButton("Compute band moments")
+        self.compute_moments_btn.clicked.connect(self.compute_moments)
+        self.compute_moments_btn.setEnabled(False)
+        moments_layout.addWidget(self.compute_moments_btn)
+        self.moments_model = RecordTableModel(parent=self)
+        moments_proxy = QtCore.QSortFilterProxyModel(self)
+        moments_proxy.setSourceModel(self.moments_model)
+        moments_proxy.setSortRole(QtCore.Qt.UserRole)
+        self.moments_table = QTableView()
+        self.moments_table.setModel(moments_proxy)
+        self.moments_table.setSortingEnabled(True)
+        moments_layout.addWidget(self.moments_table)
+
         right_tab_widget.addTab(param_tree_widget, "Parameters")
         right_tab_widget.addTab(self.scroll_area_widget, "DOS atoms & orbitals")
         right_tab_widget.addTab(empty_widget, "Structure list")
+        right_tab_widget.addTab(moments_widget, "Band moments")
         splitter.addWidget(right_tab_widget)
 
         self.console = QPlainTextEdit()
@@ -264,6 +295,96 @@ class MainWindow(QMainWindow):
         self.console.setFixedHeight(100)
         main_layout.addWidget(self.console)
 
+    def build_parameters(self):
+        if self.param is not None:
+            return
+        from pyqtgraph.parametertree import Parameter, ParameterTree
+        self.param = Parameter.create(name='params', type='group', children=[
+            {'name': 'Middle Index', 'type': 'int', 'value': 0, 'limits': (0, 15)},
+            {'name': 'Batch curves', 'type': 'bool', 'value': True},
+            {'name': 'Level of detail', 'type': 'bool', 'value': True},
+            {'name': 'Broadening', 'type': 'group', 'children': [
+                {'name': 'Kernel', 'type': 'list', 'limits': list(KERNELS), 'value': 'none'},
+                {'name': 'Sigma', 'type': 'float', 'value': 0.1, 'step': 0.01, 'limits': (0, 5), 'suffix': 'eV'},
+                {'name': 'Gamma', 'type': 'float', 'value': 0.1, 'step': 0.01, 'limits': (0, 5), 'suffix': 'eV'},
+            ]},
+        ])
+        self.param_tree = ParameterTree()
+        self.param_tree.setParameters(self.param, showTop=True)
+        self.param.sigTreeStateChanged.connect(self.parameter_changed)
+        self.param_tree_layout.insertWidget(0, self.param_tree)
+
+    def populate_data_widgets(self):
+        """(re)build everything that depends on the loaded data"""
+        self.build_parameters()
+        for checkbox in self.orbital_checkboxes:
+            checkbox.deleteLater()
+        for layout in (self.select_orbital_layout, self.deselect_orbital_layout,
+                       self.select_atom_layout, self.deselect_atom_layout):
+            while layout.count():
+                layout.takeAt(0).widget().deleteLater()
+
+        self.atom_model.set_labels(self.atoms_symb_and_num)
+
+        self.orbital_checkboxes = []
+        for i in range(len(self.orbitals)):
+            checkbox = QCheckBox(self.orbitals[i])
+            checkbox.stateChanged.connect(self.checkbox_changed)
+            self.orbital_checkboxes.append(checkbox)
+            self.scroll_right_layout.addWidget(checkbox)
+
+        ####################### Select ORBITALS buttons#################################################
+        for i, orbital_list in enumerate(self.orbital_types):
+            orb_letter = orbital_list[0] if len(orbital_list) == 1 else orbital_list[0][0]
+            btn = QPushButton(f"select {orb_letter}", self)
+            btn.clicked.connect(lambda _, x=i: self.select_orbital(x))
+            self.select_orbital_layout.addWidget(btn)
+
+        select_all_btn = QPushButton("select all", self)
+        select_all_btn.clicked.connect(self.select_all_orbitals)
+        self.select_orbital_layout.addWidget(select_all_btn)
+
+        # Deselect buttons
+        for i, orbital_list in enumerate(self.orbital_types):
+            orb_letter = orbital_list[0] if len(orbital_list) == 1 else orbital_list[0][0]
+            btn = QPushButton(f"deselect {orb_letter}", self)
+            btn.clicked.connect(lambda _, x=i: self.deselect_orbital(x))
+            self.deselect_orbital_layout.addWidget(btn)
+
+        deselect_all_btn = QPushButton("Deselect all", self)
+        deselect_all_btn.clicked.connect(self.deselect_all_orbitals)
+        self.deselect_orbital_layout.addWidget(deselect_all_btn)
+
+        ############################################ ATOMS ##########################################
+        for i, atom_list in enumerate(self.atomic_symbols):
+            atom_letter = atom_list
+            btn = QPushButton(f"select {atom_letter}", self)
+            btn.clicked.connect(lambda _, x=i: self.select_atom(x))
+            self.select_atom_layout.addWidget(btn)
+
+        select_all_atoms_btn = QPushButton("Select all", self)
+        select_all_atoms_btn.clicked.connect(self.select_all_atoms)
+        self.select_atom_layout.addWidget(select_all_atoms_btn)
+
+        for i, atom_list in enumerate(self.atomic_symbols):
+            atom_letter = atom_list
+            btn = QPushButton(f"Deselect {atom_letter}", self)
+            btn.clicked.connect(lambda _, x=i: self.deselect_atom(x))
+            self.deselect_atom_layout.addWidget(btn)
+
+        deselect_all_atoms_btn = QPushButton("Deselect all", self)
+        deselect_all_atoms_btn.clicked.connect(self.deselect_all_atoms)
+        self.deselect_atom_layout.addWidget(deselect_all_atoms_btn)
+
+        for line in (self.inf_line_full, self.inf_line_bounded):
+            line.setValue(float(self.e_fermi))
+            line.show()
+        self.plot_merged_btn.setEnabled(True)
+        self.plot_total_dos_btn.setEnabled(True)
+        self.compute_moments_btn.setEnabled(True)
+        self.export_action.setEnabled(True)
+        self.moments_model.set_records(np.zeros(0, dtype=[('', float)]))
+
     def select_atom(self, index):
         self.update_atom_checkboxes(self.partitioned_lists[index], True)
 
@@ -305,12 +426,8 @@ class MainWindow(QMainWindow):
         self.checkbox_changed()
 
     def update_atom_checkboxes(self, atom, check):
-        for checkbox in self.atom_checkboxes:
-            checkbox.blockSignals(True)
-            if checkbox.text() in atom:
-                checkbox.setChecked(check)
-            checkbox.blockSignals(False)
-        self.checkbox_changed()
+        # one mask assignment and one repaint of the list, whatever the number of atoms
+        self.atom_model.set_checked_labels(atom, check)
 
     def print_to_console(self, message):
         self.console.appendPlainText(">>> "+message)
@@ -318,100 +435,269 @@ class MainWindow(QMainWindow):
     def parameter_changed(self, param, changes):
         for param, change, data in changes:
             if change == 'value':
-                self.update_plot()
+                if param.name() == 'Level of detail':
+                    self.set_lod(data)
+                self.plot_scheduler.request()
 
     def checkbox_changed(self):
-        self.update_indexes()
-        self.update_plot()
+        self.plot_scheduler.request()
         self.orbital_up = [checkbox.text() for checkbox in self.orbital_checkboxes if checkbox.isChecked()]
-        self.atoms_up = [checkbox for checkbox in self.atom_checkboxes if checkbox.isChecked()]
 
     def update_indexes(self):
-        self.selected_atoms = [i for i, cb in enumerate(self.atom_checkboxes) if cb.isChecked()]
-        self.selected_orbitals = [i for i, cb in enumerate(self.orbital_checkboxes) if cb.isChecked()]
+        atom_mask = self.atom_model.mask
+        orbital_mask = np.array([cb.isChecked() for cb in self.orbital_checkboxes], dtype=bool)
+        self.selected_atoms = np.flatnonzero(atom_mask).tolist()
+        self.selected_orbitals = np.flatnonzero(orbital_mask).tolist()
+        # the running sums are only kept up to date while they are shown; turning merged
+        # mode on applies everything toggled since then as one delta (see plot_merged)
+        if self.merged_mode:
+            self.merged.update(atom_mask, orbital_mask)
+
+    @timed('refresh_plot')
+    def refresh_plot(self):
+        if self.data is None:
+            return
+        self.update_indexes()
+        self.redraw()
+
+    def redraw(self):
+        if self.merged_mode:
+            self.draw_merged()
+        else:
+            self.update_plot()
 
     def plot_total_dos(self):
+        self.merged_mode = False
         self.clear_plot_data(self.full_range_plot)
         self.clear_plot_data(self.bounded_plot)
         
-        self.full_range_plot.plot(self.total_alfa, self.data.doscar.total_dos_energy, pen=pg.mkPen('b'))
-        self.full_range_plot.plot([-x for x in self.total_beta], self.data.doscar.total_dos_energy, pen=pg.mkPen('b'))
-        self.bounded_plot.plot(self.total_alfa, self.data.doscar.total_dos_energy, pen=pg.mkPen('b'))
-        self.bounded_plot.plot([-x for x in self.total_beta], self.data.doscar.total_dos_energy, pen=pg.mkPen('b'))
+        doscar = self.data.doscar
+        total = self.broadener.apply(doscar.total_dos[1:1 + doscar.n_spin], *self.broadening())
+        add_shared(self.dos_plots(), mirror_spins(total), doscar.total_dos_energy, pg.mkPen('b'), self.lod())
+        self.count_plot_data()
 
     def plot_merged(self):
-        '''
-        print('starting')
-        all_data = []
-        for atom in self.selected_atoms:
-            for oribtal in self.selected_orbitals:
-                all_data.append(self.dataset_up[atom, oribtal])
-        print()
-        data_up   =   self.dataset_up[self.selected_atoms][self.selected_orbitals]
-        data_down = self.dataset_down[self.selected_atoms][self.selected_orbitals]
-        plot_color = self.color_button.color()
-
-        self.clear_plot_data(self.full_range_plot)
-        self.clear_plot_data(self.bounded_plot)
-
-        #self.full_range_plot.plot(data_up, self.data.doscar.total_dos_energy, pen=pg.mkPen(plot_color))
-        #self.bounded_plot.plot(data_up, self.data.doscar.total_dos_energy, pen=pg.mkPen(plot_color))
-
-        #self.full_range_plot.plot(plot_data, self.data.doscar.total_dos_energy, pen=pg.mkPen(plot_color))
-        #self.bounded_plot.plot(plot_data, self.data.doscar.total_dos_energy, pen=pg.mkPen(plot_color))
-        '''
-        pass
-
-
+        self.merged_mode = True
+        self.merged_curve = None
+        self.update_indexes()  # resyncs self.merged with the current selection
+        self.draw_merged()
+
+    @timed('draw_merged')
+    def draw_merged(self):
+        """show the running sums of the selection; after the first call the curves
+        only get new data, so a checkbox toggle does not rebuild the plots"""
+        energy = self.data.doscar.total_dos_energy
+        # broadening is linear, so the running sum is broadened instead of every atom
+        merged = self.broadener.apply(self.merged.total, *self.broadening())
+        curves = mirror_spins(merged)
+        if self.merged_curve is not None:
+            self.merged_curve.set_data(curves, energy)
+        else:
+            self.clear_plot_data(self.full_range_plot)
+            self.clear_plot_data(self.bounded_plot)
+            self.merged_curve = add_shared(self.dos_plots(), curves, energy, pg.mkPen(self.color_button.color()),
+                                           self.lod())
+        self.count_plot_data()
+        self.print_to_console(f'merged {len(self.selected_atoms)} atoms x {len(self.selected_orbitals)} orbitals')
+
+    @timed('update_plot')
     def update_plot(self):
-        selected_indices = [i for i, cb in enumerate(self.atom_checkboxes) if cb.isChecked()]
+        self.merged_mode = False
         middle_idx = self.param.param('Middle Index').value()
 
         # Clear only the data items, not the LinearRegionItem or InfiniteLine
         self.clear_plot_data(self.full_range_plot)
         self.clear_plot_data(self.bounded_plot)
 
-        # plot dataset up
         colors = ['b', 'r', 'g', 'c', 'm', 'y', 'k','b', 'r', 'g', 'c', 'm', 'y', 'k','b', 'r', 'g', 'c', 'm', 'y', 'k']  # Add more colors if needed
-        for atom_index in self.selected_atoms:
-            for orbital_index in self.selected_orbitals:
-                plot_color = colors[orbital_index]  # Cycle through colors
-                plot_data = self.dataset_up[atom_index][orbital_index]
-                self.full_range_plot.plot(plot_data, self.data.doscar.total_dos_energy, pen=pg.mkPen(plot_color))
-                self.bounded_plot.plot(plot_data, self.data.doscar.total_dos_energy, pen=pg.mkPen(plot_color))
-
-        # plot dataset down
-        for atom_index in self.selected_atoms:
-            for orbital_index in self.selected_orbitals:
-                plot_color = colors[orbital_index]  # Cycle through colors
-                plot_data = self.dataset_down[atom_index][orbital_index]
-                self.full_range_plot.plot([-x for x in plot_data], self.data.doscar.total_dos_energy, pen=pg.mkPen(plot_color))
-                self.bounded_plot.plot([-x for x in plot_data], self.data.doscar.total_dos_energy, pen=pg.mkPen(plot_color))
+        if self.param.param('Batch curves').value():
+            self.plot_batched(colors)
+            self.update_bounded_plot_y_range()
+            self.count_plot_data()
+            self.print_to_console(f'added {self.selected_atoms} {self.selected_orbitals}')
+            return
+
+        block = self.selected_dos()
+        # plot dataset up, then down (mirrored) if the run is spin polarised
+        for spin in range(block.shape[2]):
+            for i, atom_index in enumerate(self.selected_atoms):
+                for j, orbital_index in enumerate(self.selected_orbitals):
+                    plot_color = colors[orbital_index]  # Cycle through colors
+                    plot_data = SPIN_SIGNS[spin] * block[i, j, spin]
+                    self.full_range_plot.plot(plot_data, self.data.doscar.total_dos_energy, pen=pg.mkPen(plot_color))
+                    self.bounded_plot.plot(plot_data, self.data.doscar.total_dos_energy, pen=pg.mkPen(plot_color))
 
         self.update_bounded_plot_y_range()
+        self.count_plot_data()
         self.print_to_console(f'added {self.selected_atoms} {self.selected_orbitals}')
 
+    def count_plot_data(self):
+        """counters of the curves and items in the full range plot and the bytes they hold"""
+        items = self.full_range_plot.getPlotItem().items
+        shared = [item.curve for item in items if isinstance(item, SharedCurveItem)]
+        plain = [item for item in self.full_range_plot.listDataItems() if isinstance(item, pg.PlotDataItem)]
+        TRACE.count('plot items', len(shared) + len(plain))
+        TRACE.count('curves drawn', sum(len(curve.curves) for curve in shared) + len(plain))
+        TRACE.count('bytes plotted', held_bytes([[curve.curves, curve.energy] for curve in shared])
+                    + held_bytes([[item.xData, item.yData] for item in plain]))
+
+    def dos_plots(self):
+        return (self.full_range_plot, self.bounded_plot)
+
+    def compute_moments(self):
+        """centre (relative to E_Fermi), width, skewness, kurtosis and filling of
+        every atom x shell x spin of the DOS as shown, i.e. broadened if set"""
+        groups = shell_groups(self.orbitals, self.orbital_types)
+        table = band_table(self.broadener.pdos(*self.broadening()), self.data.doscar.total_dos_energy, self.e_fermi,
+                           groups, self.atoms_symb_and_num)
+        self.moments_model.set_records(table)
+        self.moments_table.resizeColumnsToContents()
+        self.print_to_console(f'band moments of {self.number_of_atoms} atoms x {len(groups)} shells')
+
+    def broadening(self):
+        """kernel, sigma and gamma set in the Parameters tab"""
+        group = self.param.param('Broadening')
+        return group.param('Kernel').value(), group.param('Sigma').value(), group.param('Gamma').value()
+
+    def selected_dos(self):
+        """(atoms, orbitals, n_spin, nedos) projected DOS of the selection as shown:
+        only the selection is broadened, and cached per width and selection, so
+        scrubbing back to an earlier value is instant"""
+        return self.broadener.select(self.selected_atoms, self.selected_orbitals, *self.broadening())
+
+    def lod(self):
+        return self.param.param('Level of detail').value()
+
+    def set_lod(self, lod):
+        """switch min/max decimation of the shared curves on or off; the full range
+        plot then draws one bin per pixel, the bounded plot full detail of its window"""
+        for plot in self.dos_plots():
+            for item in plot.getPlotItem().items:
+                if isinstance(item, SharedCurveItem):
+                    item.lod = lod
+                    item.update()
+
+    @timed('plot_batched')
+    def plot_batched(self, colors):
+        """draw all selected curves of one colour, up and down spin, as a single item
+        per plot, so the number of scene items does not grow with the selection;
+        both plots share the packed data and its path"""
+        energy = self.data.doscar.total_dos_energy
+        atoms = np.asarray(self.selected_atoms, dtype=int)
+        if len(atoms) == 0:
+            return
+        selection = self.selected_dos()
+        for plot_color, orbitals in group_by_color(self.selected_orbitals, colors).items():
+            block = selection[:, [self.selected_orbitals.index(orbital) for orbital in orbitals]]
+            add_shared(self.dos_plots(), mirror_spins(block), energy, pg.mkPen(plot_color), self.lod())
+
+    @timed('clear_plot_data')
     def clear_plot_data(self, plot_widget):
         items = [item for item in plot_widget.listDataItems() if isinstance(item, pg.PlotDataItem)]
+        items += [item for item in plot_widget.getPlotItem().items if isinstance(item, SharedCurveItem)]
         for item in items:
             plot_widget.removeItem(item)
 
+    def region_changed(self):
+        if not self.syncing_range:
+            self.region_scheduler.request()
+
+    def bounded_range_changed(self):
+        if not self.syncing_range:
+            self.range_scheduler.request()
+
+    @timed('region sync')
     def update_bounded_plot_y_range(self):
         min_y, max_y = self.region.getRegion()
-        self.bounded_plot.setYRange(min_y, max_y, padding=0)
-
+        # the range change this causes must not move the region back
+        self.syncing_range = True
+        try:
+            self.bounded_plot.setYRange(min_y, max_y, padding=0)
+        finally:
+            self.syncing_range = False
+
+    @timed('range sync')
     def update_region_from_bounded_plot(self):
         view_range = self.bounded_plot.viewRange()[1]
-        self.region.setRegion(view_range)
-
-    def create_data(self):
-        if platform.system() == 'Linux':
-            file = './'
-        elif platform.system() == 'Windows':
-            file = "F:\\syncme\\modelowanie DFT\\CeO2\\CeO2_bulk\\Ceria_bulk_vacancy\\0.Ceria_bulk_1vacancy\\scale_0.98"
-            #self.data = VaspData("D:\\OneDrive - Uniwersytet Jagielloński\\modelowanie DFT\\czasteczki\\O2")
-            #self.data = VaspData("D:\\OneDrive - Uniwersytet Jagielloński\\modelowanie DFT\\co3o4_new_new\\2.ROS\\1.large_slab\\1.old_random_mag\\6.CoO-O_CoO-O\\antiferro\\HSE\\DOS_new")
-        self.data = VaspData(file)
+        self.syncing_range = True
+        try:
+            self.region.setRegion(view_range)
+        finally:
+            self.syncing_range = False
+
+    def default_directory(self):
+        if platform.system() == 'Windows':
+            return "F:\\syncme\\modelowanie DFT\\CeO2\\CeO2_bulk\\Ceria_bulk_vacancy\\0.Ceria_bulk_1vacancy\\scale_0.98"
+            #return "D:\\OneDrive - Uniwersytet Jagielloński\\modelowanie DFT\\czasteczki\\O2"
+            #return "D:\\OneDrive - Uniwersytet Jagielloński\\modelowanie DFT\\co3o4_new_new\\2.ROS\\1.large_slab\\1.old_random_mag\\6.CoO-O_CoO-O\\antiferro\\HSE\\DOS_new"
+        return './'
+
+    def open_directory(self):
+        directory = QFileDialog.getExistingDirectory(self, "Open VASP directory")
+        if directory:
+            self.start_loading(directory)
+
+    def open_export(self):
+        filename, _ = QFileDialog.getOpenFileName(self, "Open exported DOS", "",
+                                                  "Exported DOS (*.h5 *.hdf5 *.parquet *.pq)")
+        if filename:
+            self.start_loading(filename)
+
+    def export_dos(self):
+        """write energies, total DOS, the full PDOS cube and POSCAR data, chunked per atom"""
+        filename, chosen = QFileDialog.getSaveFileName(self, "Export DOS", "", "HDF5 (*.h5);;Parquet (*.parquet)")
+        if not filename:
+            return
+        if not dos_export.is_export(filename):
+            filename += '.parquet' if chosen.startswith('Parquet') else '.h5'
+        try:
+            dos_export.export(self.data, filename)
+        except (ImportError, ValueError, OSError) as error:
+            self.print_to_console(f'export failed: {error}')
+            return
+        self.print_to_console(f'exported DOS to {filename}')
+
+    def start_loading(self, directory):
+        """parse ``directory`` in a background thread; a load or cache fill still
+        running is cancelled, so two fills never write the same cache"""
+        for loader in self.loaders:
+            loader.cancel()
+        lazy = True if self.lazy_action.isChecked() else None
+        self.loader = DataLoader(directory, functools.partial(load_data, lazy=lazy), fill_cache)
+        self.loader.message.connect(self.print_to_console)
+        self.loader.loaded.connect(self.data_loaded)
+        self.loader.failed.connect(self.print_to_console)
+        self.loader.thread.finished.connect(self.loader_finished)
+        self.loaders.append(self.loader)
+        self.loader.start()
+
+    def data_loaded(self, data):
+        if self.sender() is not self.loader:
+            return  # superseded by a newer load
+        self.loader = None
+        self.merged_mode = False
+        self.merged_curve = None
+        self.clear_plot_data(self.full_range_plot)
+        self.clear_plot_data(self.bounded_plot)
+        self.create_data(data)
+        self.populate_data_widgets()
+        if isinstance(data.doscar.dos, LazyAtomBlocks):
+            self.print_to_console(f'{self.number_of_atoms} atoms indexed, each is decoded when first used; '
+                                  f'the DOSCAR cache is written in the background')
+
+    def loader_finished(self):
+        self.sender().wait()
+        self.loaders = [loader for loader in self.loaders if loader.thread is not self.sender()]
+
+    def closeEvent(self, event):
+        for loader in self.loaders:
+            loader.cancel()
+            loader.thread.wait()
+        super().closeEvent(event)
+
+    @timed('create_data')
+    def create_data(self, data):
+        self.data = data
         self.dataset_down = self.data.data_down
         self.dataset_up = self.data.data_up
         self.number_of_atoms = self.data.number_of_atoms
@@ -423,6 +709,10 @@ class MainWindow(QMainWindow):
         self.atomic_symbols = self.data.atomic_symbols
         self.total_alfa = self.data.total_alfa
         self.total_beta = self.data.total_beta
+        self.merged = SelectionAccumulator(self.data.doscar.dos)
+        self.broadener = Broadener(self.data.doscar.dos, self.data.doscar.total_dos_energy)
+        TRACE.count('bytes DOS', held_bytes(self.data.doscar.dos))
+        TRACE.count('bytes broadened DOS', 0)
 
 
         self.partitioned_lists = [[] for _ in range(len(self.atomic_symbols))]
@@ -437,7 +727,7 @@ class MainWindow(QMainWindow):
 
 def main():
     app = QApplication(sys.argv)
-    mainWin = MainWindow()
+    mainWin = MainWindow(sys.argv[1] if len(sys.argv) > 1 else None)
     mainWin.print_to_console(' Welcome to DOSwizard! This is very experimental! ')
     mainWin.print_to_console('            use at your own risk.                 ')
     mainWin.show()
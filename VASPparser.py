@@ -1,52 +1,168 @@
+import io
 import os
+from collections import OrderedDict, namedtuple
+from itertools import islice
+import numpy as np
+import doscar_cache
+import geometry
+from instrumentation import TRACE, timed
+
+IonicStep = namedtuple('IonicStep', ['positions', 'forces', 'energy'])
+
+
+def read_nions(filename):
+    """number of ions from the NIONS entry in the OUTCAR header"""
+    with open(filename, 'r') as file:
+        for line in file:
+            if 'NIONS' in line:
+                return int(line.split('NIONS')[1].split('=')[1].split()[0])
+    raise ValueError(f'no NIONS entry in {filename}')
+
+
+def iter_ionic_steps(filename, atom_count=None):
+    """stream an OUTCAR line by line and yield one IonicStep per ionic step
+
+    positions and forces are (N, 3) arrays from the POSITION / TOTAL-FORCE block,
+    energy is the free energy TOTEN in eV; memory use does not depend on file length
+    """
+    if atom_count is None:
+        atom_count = read_nions(filename)
+    block = None
+    with open(filename, 'r') as file:
+        for line in file:
+            line = line.strip()
+            if line.startswith('POSITION'):
+                file.readline()  # dashes
+                block = np.loadtxt(islice(file, atom_count), usecols=range(6), ndmin=2)
+            elif line.startswith('FREE ENERGIE'):
+                file.readline()
+                energy = float(file.readline().split()[4])
+                if block is None:
+                    yield IonicStep(None, None, energy)
+                else:
+                    yield IonicStep(block[:, :3], block[:, 3:6], energy)
+                block = None
+    if block is not None:
+        yield IonicStep(block[:, :3], block[:, 3:6], np.nan)
+
+
+def count_ionic_steps(filename, progress=None, every=1 << 16):
+    """number of POSITION blocks in an OUTCAR; progress(bytes read, file size) is
+    called every ``every`` lines, an exception raised from it stops the scan"""
+    count = 0
+    with open(filename, 'rb') as file:
+        size = os.fstat(file.fileno()).st_size
+        for i, line in enumerate(file, 1):
+            if line.lstrip().startswith(b'POSITION'):
+                count += 1
+            if progress is not None and i % every == 0:
+                progress(file.tell(), size)
+    return count
+
+
+def read_trajectory(filename, out=None, atom_count=None):
+    """write positions of all ionic steps into an (n_steps, N, 3) array
+
+    ``out`` may be a preallocated array or the path of a .npy file, which is then
+    created as a memmap; returns the positions and an (n_steps,) array of energies
+    """
+    if atom_count is None:
+        atom_count = read_nions(filename)
+    if out is None or isinstance(out, str):
+        shape = (count_ionic_steps(filename), atom_count, 3)
+        if out is None:
+            out = np.empty(shape, dtype=float)
+        else:
+            out = np.lib.format.open_memmap(out, mode='w+', dtype=float, shape=shape)
+    energies = np.full(len(out), np.nan)
+    i = 0
+    for step in iter_ionic_steps(filename, atom_count):
+        if step.positions is None:
+            continue
+        if i == len(out):
+            break
+        out[i] = step.positions
+        energies[i] = step.energy
+        i += 1
+    if isinstance(out, np.memmap):
+        out.flush()
+    return out, energies
+
+
+def read_cartesian_positions(filename, atom_count):
+    """initial positions from the 'position of ions in cartesian' table"""
+    with open(filename, 'r') as file:
+        for line in file:
+            if line.strip().startswith('position of ions in cartesian'):
+                return np.loadtxt(islice(file, atom_count), usecols=range(3), ndmin=2)
+    return None
+
+
+def read_magnetization_table(file, atom_count):
+    """parse a 'magnetization (x)' table from a binary file positioned at its title
+
+    returns (column names, (N, columns) array), or None if the table is cut off
+    """
+    file.readline()  # title
+    columns = None
+    for _ in range(4):
+        line = file.readline()
+        if line.lstrip().startswith(b'# of ion'):
+            columns = line.decode().split()[3:]
+            break
+    if columns is None:
+        return None
+    file.readline()  # dashes
+    rows = list(islice(file, atom_count))
+    if len(rows) < atom_count or not file.readline().lstrip().startswith(b'---'):
+        return None
+    values = np.loadtxt([row.decode() for row in rows], usecols=range(1, len(columns) + 1), ndmin=2)
+    return columns, values
+
+
+def last_magnetization(filename, atom_count, axis='x', window=1 << 16):
+    """find the last complete magnetization table by reading the file backwards
+    in growing chunks, so only the tail of a large OUTCAR is read"""
+    tag = f'magnetization ({axis})'.encode()
+    with open(filename, 'rb') as file:
+        size = os.fstat(file.fileno()).st_size
+        while True:
+            window = min(window, size)
+            file.seek(size - window)
+            data = file.read(window)
+            position = data.rfind(tag)
+            # a table cut off at the end of the file (running job) is skipped
+            while position != -1:
+                table = read_magnetization_table(io.BytesIO(data[position:]), atom_count)
+                if table is not None:
+                    return table
+                position = data.rfind(tag, 0, position)
+            if window == size:
+                raise ValueError(f'no complete {tag.decode()} table in {filename}')
+            window *= 4
+
 
 class OutcarParser:
     """Class to parse a OUTCAR file"""
 
-    def __init__(self, filename):
+    @timed('outcar.parse')
+    def __init__(self, filename, atom_count=None):
         """parse OUTCAR and find positions of atoms and energy at each geometry"""
         self.filename = filename
-        self.data = []
+        self.atom_count = atom_count if atom_count is not None else read_nions(filename)
         self.energies = []
         self.positions = []
-        self.poscar = PoscarParser('POSCAR')
-        self.atom_count = self.poscar.number_of_atoms()
-
-        with open(self.filename, 'r') as file:
-            lines = file.readlines()
-            lenght = len(lines)
-            for i in range(lenght):
-                if i % 10000 == 0:
-                    print('reading OUTCAR file; line: ', i, f' out of {lenght}', end='\r')
-                line = lines[i].strip()
-                section_position = []
-                if line.startswith('POSITION'):
-                    i += 2
-                    current_i = i
-                    for i in range(current_i, current_i + self.atom_count):
-                        line = lines[i]
-                        position_data = line.split()
-                        atom_data = [float(x) for x in position_data[:3]]
-                        section_position.append(atom_data)
-                    self.positions.append([section_position])
-                elif line.startswith('FREE ENERGIE'):
-                    i += 2
-                    energy_data = lines[i].strip().split()[4]
-                    self.energies.append(float(energy_data))
-            if section_position==[]:
-                for i in range(lenght):
-                    line = lines[i].strip()
-                    if line.startswith('position of ions in cartesian'):
-                        i += 1
-                        current_i = i
-                        for i in range(current_i, current_i + self.atom_count):
-                            line = lines[i]
-                            position_data = line.split()
-                            atom_data = [float(x) for x in position_data[:3]]
-                            section_position.append(atom_data)
-                        self.positions.append(section_position)
-
-        print('\n')
+        self.forces = []
+        for step in iter_ionic_steps(self.filename, self.atom_count):
+            if not np.isnan(step.energy):
+                self.energies.append(step.energy)
+            if step.positions is not None:
+                self.positions.append(step.positions)
+                self.forces.append(step.forces)
+        if not self.positions:
+            positions = read_cartesian_positions(self.filename, self.atom_count)
+            if positions is not None:
+                self.positions.append(positions)
 
     def find_coordinates(self):
         """returns coordinates of each electronically converged calculation step"""
@@ -55,66 +171,87 @@ class OutcarParser:
     def find_energy(self):
         """returns converged energy in eV"""
         return self.energies
-        
+
+    @timed('outcar.magnetization')
+    def magnetization(self, axis='x'):
+        """per-atom moments of the last complete magnetization table as an (N, columns)
+        array; column names (s, p, d, [f,] tot) are stored in magnetization_columns"""
+        self.magnetization_columns, values = last_magnetization(self.filename, self.atom_count, axis)
+        return values
+
     def find_magnetization(self):
-        search_string = 'magnetization'
-        with open(self.filename, 'r') as file:
-            file.seek(0, 2)
-            file.seek(file.tell() - 6500, 0)
-            file.readline()
-            lines = file.readlines()
-            file.seek(file.tell() - 6500, 0)
-            file.readline()
-            i=0
-            while i < len(lines):
-                i+=1
-                line = file.readline()
-                if search_string in line:
-                    j = 0
-                    while j < 10:
-                        j+=1
-                        line=file.readline()
-                        line=line.strip()
-                        if line.startswith('1'):
-                            lines_mag = file.readlines()
-                            lines_mag=[line.strip() for line in lines_mag]
-                            break
-                    break
-        lines_mag.insert(0,line)
-        lines_mag=[el.split() for el in lines_mag]
-        lines_mag=lines_mag[:self.poscar.number_of_atoms()]
-        mag_values=[lst[-1] for lst in lines_mag]
-        return mag_values
+        """returns total magnetic moment of every atom from the end of OUTCAR"""
+        return self.magnetization()[:, -1]
 
 
 class PoscarParser:
-    """class to parse POSCAR / CONTCAR files"""
+    """class to parse POSCAR / CONTCAR files
 
+    the file is parsed once in __init__ into NumPy arrays (lattice, coordinates,
+    selective dynamics flags, counts); the accessor methods return the stored results
+    """
+
+    @timed('poscar.parse')
     def __init__(self, filename):
         self.filename = filename
-        self.atom_symbols_exists = None
-        self.dynamic_exists = None
-        self.total_atoms = 0
         with open(self.filename, 'r') as file:
             self.lines = file.readlines()
-            self.scale = self.scale_factor()
-            self.unit_cell_vectors()
-            self.atomic_symbols()
-            self.dynamics()
+        lines = self.lines
+        self._title = lines[0].strip()
+        self.scale = float(lines[1].split()[0])
+        lattice = np.array([line.split()[:3] for line in lines[2:5]], dtype=float)
+        if self.scale < 0:  # negative scale factor is the cell volume
+            self.scaling = (-self.scale / abs(np.linalg.det(lattice))) ** (1 / 3)
+        else:
+            self.scaling = self.scale
+        self.lattice = lattice * self.scaling
+
+        line = 5
+        self.atom_symbols_exists = not PoscarParser.is_integer(lines[line].split()[0])
+        if self.atom_symbols_exists:
+            self._atomic_symbols = lines[line].split()
+            line += 1
+        else:
+            self._atomic_symbols = self.potcar_symbols()
+        self.counts = np.array([int(value) for value in lines[line].split()], dtype=int)
+        self.total_atoms = int(self.counts.sum())
+        line += 1
+
+        self.dynamic_exists = lines[line].strip()[:1].lower() == "s"
+        self._dynamics = lines[line].strip() if self.dynamic_exists else 'no dynamics'
+        if self.dynamic_exists:
+            line += 1
+        self._coordinate_type = lines[line].strip()
+        self.is_direct = self._coordinate_type[:1].lower() not in ('c', 'k')
+        line += 1
+
+        tokens = [coordinate_line.split() for coordinate_line in lines[line:line + self.total_atoms]]
+        self.coords = np.array([values[:3] for values in tokens], dtype=float).reshape(-1, 3)
+        if self.dynamic_exists:
+            self.selective_flags = np.array([[flag.upper().startswith('T') for flag in values[3:6]]
+                                             for values in tokens], dtype=bool).reshape(-1, 3)
+        else:
+            self.selective_flags = np.ones((self.total_atoms, 3), dtype=bool)
+        self._constrains = [values[3] if len(values) >= 6 else 'n/a' for values in tokens]
+
+        self._list_atomic_symbols = [s for s, c in zip(self._atomic_symbols, self.counts) for _ in range(c)]
+        self._symbol_and_number = [str(symbol) + str(number) for symbol, number in
+                                   zip(self._list_atomic_symbols, range(1, self.total_atoms + 1))]
+        if self.is_direct:  # convert from direct to cartesian
+            self.fractional = self.coords
+            self.cartesian = geometry.frac_to_cart(self.coords, self.lattice)
+        else:
+            self.cartesian = self.coords * self.scaling
+            self.fractional = geometry.cart_to_frac(self.cartesian, self.lattice)
 
     def title(self):
-        title = self.lines[0].strip()
-        return title
+        return self._title
 
     def scale_factor(self):
-        scale_factor = float(self.lines[1].strip())
-        return scale_factor
+        return self.scale
 
     def unit_cell_vectors(self):
-        unit_cell_vectors = []
-        for line in self.lines[2:5]:
-            unit_cell_vectors.append([float(value)*self.scale_factor() for value in line.split()])
-        return unit_cell_vectors
+        return self.lattice
 
     @staticmethod
     def is_integer(string):
@@ -124,182 +261,467 @@ class PoscarParser:
         except ValueError:
             return False
 
-    def atomic_symbols(self):
-        atom_symbols = []
-        if PoscarParser.is_integer(self.lines[5].split()[0]):
-            self.atom_symbols_exists = False
-            if os.path.exists('POTCAR'):
-                potcar = 'POTCAR'
-            elif os.path.exists('../POTCAR'):
-                potcar = '../POTCAR'
-            else:
-                raise FileNotFoundError('Error! No POTCAR file found!')
-            with open(potcar, 'r') as file:
-                lines = file.readlines()
-                lenght = len(lines)
-                first = lines[0].split()
-                atom_symbols.append(first[1])
-
-                for i in range(1, lenght - 10):
-                    if lines[i].strip().startswith('End of Dataset'):
-                        i += 1
-                        method_line = lines[i].split()
-                        atom_symbols.append(method_line[1])
+    def potcar_symbols(self):
+        """element symbols from the POTCAR next to the POSCAR (or in the working directory)"""
+        directory = os.path.dirname(self.filename)
+        for potcar in (os.path.join(directory, 'POTCAR'), os.path.join(directory, '..', 'POTCAR'),
+                       'POTCAR', os.path.join('..', 'POTCAR')):
+            if os.path.exists(potcar):
+                break
         else:
-            self.atom_symbols_exists = True
-            atom_symbols = self.lines[5].split()
+            raise FileNotFoundError('Error! No POTCAR file found!')
+        atom_symbols = []
+        with open(potcar, 'r') as file:
+            atom_symbols.append(file.readline().split()[1])
+            take_next = False
+            for line in file:
+                if take_next:
+                    fields = line.split()
+                    if len(fields) > 1:
+                        atom_symbols.append(fields[1])
+                    take_next = False
+                elif line.strip().startswith('End of Dataset'):
+                    take_next = True
         return atom_symbols
 
+    def atomic_symbols(self):
+        return self._atomic_symbols
+
     def list_atomic_symbols(self):
-        symbol_list = [s for s, c in zip(self.atomic_symbols(), self.atom_counts()) for _ in range(c)]
-        return symbol_list
+        return self._list_atomic_symbols
 
     def atom_counts(self):
-        if self.atom_symbols_exists:
-            counts = [int(value) for value in self.lines[6].split()]
-        else:
-            counts = [int(value) for value in self.lines[5].split()]
-        return counts
+        return self.counts.tolist()
 
     def number_of_atoms(self):
-        self.total_atoms = sum(self.atom_counts())
-        return sum(self.atom_counts())
+        return self.total_atoms
 
     def symbol_and_number(self):
-        sym_num_list = []
-        for symbol, number in zip(self.list_atomic_symbols(), range(1, self.number_of_atoms() + 1)):
-            sym_num_list.append(str(symbol) + str(number))
-        return sym_num_list
+        return self._symbol_and_number
 
     def dynamics(self):
-        if self.atom_symbols_exists and self.lines[7].strip()[0].lower() == "s":
-            self.dynamic_exists = True
-            return self.lines[7].strip()
-        elif self.atom_symbols_exists is False and self.lines[6].strip()[0].lower() == "s":
-            self.dynamic_exists = True
-            return self.lines[6].strip()
-        else:
-            self.dynamic_exists = False
-            return 'no dynamics'
+        return self._dynamics
 
     def coordinate_type(self):
-        if self.atom_symbols_exists and self.dynamic_exists:
-            return self.lines[8].strip()
-        elif self.atom_symbols_exists and self.dynamic_exists is False:
-            return self.lines[7].strip()
-        elif self.atom_symbols_exists is False and self.dynamic_exists:
-            return self.lines[7].strip()
-        elif self.atom_symbols_exists is False and self.dynamic_exists is False:
-            return self.lines[6].strip()
+        return self._coordinate_type
 
     def parse_coordinates(self):
-        start_line = None
-        if self.atom_symbols_exists and self.dynamic_exists:
-            start_line = 9
-        elif self.atom_symbols_exists and self.dynamic_exists is False:
-            start_line = 8
-        elif self.atom_symbols_exists is False and self.dynamic_exists:
-            start_line = 8
-        elif self.atom_symbols_exists is False and self.dynamic_exists is False:
-            start_line = 7
-        coordinates = []
-        constrain = []
-        for line in self.lines[start_line:start_line + self.number_of_atoms()]:
-            values = line.split()
-            coordinates.append([float(value) for value in values[:3]])
-            if len(values) == 6:
-                constrain.append(values[3])
-            else: 
-                constrain.append('n/a')
-        if self.coordinate_type() == "Direct":  # convert from direct to cartesian
-            coords_cart = []
-            for coor in coordinates:
-                x = coor[0] * self.unit_cell_vectors()[0][0]
-                y = coor[1] * self.unit_cell_vectors()[1][1]
-                z = coor[2] * self.unit_cell_vectors()[2][2]
-                coords_cart.append([x, y, z])
-            return coords_cart, constrain
-        else:
-            return coordinates, constrain
+        return self.cartesian, self._constrains
 
     def coordinates(self):
-        return self.parse_coordinates()[0]
+        return self.cartesian
 
     def constrains(self):
-        constrain = self.parse_coordinates()[1]
-        if len(constrain[0]) == 0:
-            return ['n/a']*self.total_atoms
-        else:
-            return self.parse_coordinates()[1]
+        return self._constrains
+
+
+# number of projected columns in an atom block -> (element block, orbitals, orbital types)
+# ISPIN=2: columns alternate spin up / spin down for every orbital
+ORBITAL_LAYOUTS = {
+    2: ('s', ["s"], [["s"]]),
+    8: ('p', ["s", "py", "pz", "px"], [["s"], ["py", "pz", "px"]]),
+    18: ('d', ["s", "py", "pz", "px", "dxy", "dyz", "dz", "dxz", "dx2y2"],
+         [["s"], ["py", "pz", "px"], ["dxy", "dyz", "dz", "dxz", "dx2y2"]]),
+    32: ('f', ["s", "py", "pz", "px", "dxy", "dyz", "dz", "dxz", "dx2y2", "fy(3x2-y2)", "fxyz", "fyz2",
+               "fz3", "fxz2", "fz(x2-y2)", "fx(x2-3y2)"],
+         [["s"], ["py", "pz", "px"], ["dxy", "dyz", "dz", "dxz", "dx2y2"],
+          ["fy(3x2-y2)", "fxyz", "fyz2", "fz3", "fxz2", "fz(x2-y2)", "fx(x2-3y2)"]]),
+}
+# ISPIN=1: one column per orbital
+ORBITAL_LAYOUTS.update({n_columns // 2: layout for n_columns, layout in list(ORBITAL_LAYOUTS.items())})
+
+
+def parse_block(lines):
+    """parse DOSCAR lines into a (lines, columns) float array; ``lines`` may be
+    any iterable, e.g. islice(file, nedos), and is consumed in batches"""
+    return np.loadtxt(lines, dtype=float, ndmin=2)
+
+
+def line_offsets(filename, line_numbers, chunk_size=1 << 24, progress=None):
+    """byte offsets at which the given line numbers start, found by counting
+    newlines in large binary chunks; progress(bytes scanned, file size) is called
+    after every chunk, an exception raised from it stops the scan"""
+    targets = sorted(set(line_numbers))
+    found = {}
+    k = 0
+    lines_before = 0
+    base = 0
+    with open(filename, 'rb') as file:
+        size = os.fstat(file.fileno()).st_size
+        while k < len(targets):
+            chunk = file.read(chunk_size)
+            if not chunk:
+                break
+            newlines = np.flatnonzero(np.frombuffer(chunk, dtype=np.uint8) == 10)
+            while k < len(targets) and targets[k] - lines_before <= len(newlines):
+                n = targets[k] - lines_before
+                found[targets[k]] = base + int(newlines[n - 1]) + 1 if n > 0 else base
+                k += 1
+            lines_before += len(newlines)
+            base += len(chunk)
+            if progress is not None:
+                progress(base, size)
+    if k < len(targets):
+        raise ValueError(f'{filename} has only {lines_before} lines, line {targets[k]} requested')
+    return [found[line] for line in line_numbers]
+
+
+def read_atom_block(file, offset, nedos):
+    """parse the atom block whose header line starts at ``offset`` of a binary file"""
+    file.seek(offset)
+    file.readline()  # block header
+    return parse_block([line.decode() for line in islice(file, nedos)])
+
+
+def block_to_orbitals(block, nedos, n_orbitals, n_spin=2):
+    """reorder a parsed (nedos, 1 + columns) atom block to (n_orbitals, n_spin, nedos)"""
+    return block[:, 1:].reshape(nedos, n_orbitals, n_spin).transpose(1, 2, 0)
+
+
+def decode_atoms(filename, atoms, offsets, nedos, n_orbitals, n_spin, target):
+    """worker of DOSCARparser.parse_parallel: decode the given atoms and write them
+    into the shared output, either ('npy', path) or ('shm', name, shape)"""
+    from multiprocessing import shared_memory
+    shm = None
+    if target[0] == 'npy':
+        dos = np.load(target[1], mmap_mode='r+')
+    else:
+        shm = shared_memory.SharedMemory(name=target[1])
+        dos = np.ndarray(target[2], dtype=float, buffer=shm.buf)
+    with open(filename, 'rb') as file:
+        for atom, offset in zip(atoms, offsets):
+            dos[atom] = block_to_orbitals(read_atom_block(file, offset, nedos), nedos, n_orbitals, n_spin)
+    if shm is None:
+        dos.flush()
+    del dos
+    if shm is not None:
+        shm.close()
+    return len(atoms)
+
+
+class LazyAtomBlocks:
+    """per-atom projected DOS decoded from DOSCAR only when first requested
+
+    ``blocks[atom]`` returns a (n_orbitals, n_spin, nedos) array like a row of
+    DOSCARparser.dos; at most ``max_resident`` decoded atoms are kept, the least
+    recently used ones are dropped first
+    """
+
+    def __init__(self, doscar, offsets, max_resident=64):
+        self.doscar = doscar
+        self.offsets = offsets
+        self.max_resident = max_resident
+        self.resident = OrderedDict()
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def __getitem__(self, atom):
+        atom = range(len(self))[atom]
+        if atom in self.resident:
+            self.resident.move_to_end(atom)
+            return self.resident[atom]
+        with open(self.doscar.filename, 'rb') as file:
+            block = self.doscar.block_to_orbitals(read_atom_block(file, self.offsets[atom], self.doscar.nedos))
+        block.flags.writeable = False
+        TRACE.add('lazy atoms decoded')
+        self.resident[atom] = block
+        while len(self.resident) > self.max_resident:
+            self.resident.popitem(last=False)
+        return block
+
+    def __iter__(self):
+        for atom in range(len(self)):
+            yield self[atom]
+
+
+class SpinView:
+    """``view[atom][orbital]`` access to one spin channel of LazyAtomBlocks"""
+
+    def __init__(self, blocks, spin):
+        self.blocks = blocks
+        self.spin = spin
+
+    def __len__(self):
+        return len(self.blocks)
+
+    def __getitem__(self, atom):
+        return self.blocks[atom][:, self.spin, :]
+
+    def __iter__(self):
+        for atom in range(len(self)):
+            yield self[atom]
 
 
 class DOSCARparser:
-
-    def __init__(self, file):
-        with open(file, 'r') as file:
-            lines = file.readlines()
-            self.number_of_atoms = int(lines[0].strip().split()[0])
-            info_line_full = lines[5]
-            info_line = info_line_full.strip().split()
-            stop_nrg, start_nrg, nedos, self.efermi = [info_line[i] for i in range(4)]
-            nedos = int(nedos)
-            dos_parts = list(self.splitter(lines[6:], nedos + 1))
-
-            total_dos = [line.strip().split() for line in dos_parts[0]]
-            self.total_dos_energy = [float(x) for x in list(map(lambda sublist: sublist[0], total_dos))]
-            self.total_dos_alfa = [float(x) for x in list(map(lambda sublist: sublist[1], total_dos))]
-            self.total_dos_beta = [float(x) for x in list(map(lambda sublist: sublist[2], total_dos))]
-            dos_parts = [list for list in dos_parts[1:]]
-            dos_parts = [[line.strip().split() for line in sublist] for sublist in dos_parts]
-            self.dos_parts = [[[float(x) for x in list[1:]] for list in sublist] for sublist in dos_parts]
-            del lines
-            if len(self.dos_parts[0][0]) == 18:
-                self.element_block = 'd'
-                self.orbitals = ["s", "py", "pz", "px", "dxy", "dyz", "dz", "dxz", "dx2y2"]
-                self.orbital_types = [["s"], ["py", "pz", "px"], ["dxy", "dyz", "dz", "dxz", "dx2y2"]]
-            elif len(self.dos_parts[0][0]) == 8:
-                self.element_block = 'p'
-                self.orbitals = ["s", "py", "pz", "px"]
-                self.orbital_types =[["s"], ["py", "pz", "px"]]
-            elif len(self.dos_parts[0][0]) == 32:
-                self.element_block = 'f'
-                self.orbitals = ["s", "py", "pz", "px", "dxy", "dyz", "dz", "dxz", "dx2y2", "fy(3x2-y2)", "fxyz", "fyz2",
-                            "fz3", "fxz2", "fz(x2-y2)", "fx(x2-3y2)"]
-                self.orbital_types =[["s"], ["py", "pz", "px"], ["dxy", "dyz", "dz", "dxz", "dx2y2"], ["fy(3x2-y2)", "fxyz", "fyz2",
-                            "fz3", "fxz2", "fz(x2-y2)", "fx(x2-3y2)"]]
-            elif len(self.dos_parts[0][0]) == 2:
-                self.element_block = 's'
-                self.orbitals = ["s"]
-                self.orbital_types = [["s"]]
-            else:
-                '''raise error'''
-                pass
-            self.dataset_up = []
-            small_dataset_up = []
-            self.dataset_down = []
-            small_dataset_down = []
-            for i in range(self.number_of_atoms):
-                for j in range(0, 2 * len(self.orbitals), 2):
-                    small_dataset_up.append(list(map(lambda sublist: sublist[j], self.dos_parts[i])))
-                self.dataset_up.append(small_dataset_up)
-                small_dataset_up = []
-            for i in range(self.number_of_atoms):
-                for j in range(1, 2 * len(self.orbitals) + 1, 2):
-                    small_dataset_down.append(list(map(lambda sublist: sublist[j], self.dos_parts[i])))
-                self.dataset_down.append(small_dataset_down)
-                small_dataset_down = []
-
-
-
-
-
-    def splitter(self, list, size):
-        for i in range(0, len(list), size):
-            yield list[i:i + size - 1]
+    """class to parse DOSCAR files
+
+    projected DOS is kept in one contiguous array ``dos`` of shape
+    (n_atoms, n_orbitals, n_spin, nedos); ``dataset_up`` and ``dataset_down``
+    are views of it, so ``dataset_up[atom][orbital]`` is a 1D array over ``energy``.
+    n_spin is 1 for ISPIN=1 runs, which have no ``dataset_down`` / ``total_dos_beta`` (None)
+    """
+
+    def __init__(self, file, cache=False, lazy=False, max_resident=64, workers=None, progress=None):
+        """parse DOSCAR; with cache=True the data is memory-mapped from a sidecar
+        cache when it matches the file, and the cache is (re)built otherwise.
+        with lazy=True only the byte offsets of the atom blocks are read and an
+        atom is decoded on first access, see LazyAtomBlocks; a lazy parse does not
+        write the cache, fill_cache() does that afterwards.
+        with workers=N the atom blocks are decoded by N processes.
+        progress(done, total, what) is called as atom blocks are decoded (what is
+        'atoms parsed') and while a lazy or parallel parse scans the file for the
+        atom blocks ('MB indexed'); an exception raised from it aborts the parse.
+        header, total DOS and the cache check are short and not interrupted"""
+        self.filename = file
+        self.progress = progress
+        if cache and self.load_cache():
+            return
+        if lazy:
+            self.index(max_resident)
+            return
+        if workers and workers > 1:
+            self.parse_parallel(workers, in_place=cache)
+        else:
+            self.parse()
+        if cache:
+            with TRACE.span('doscar.cache save'):
+                doscar_cache.save(self.filename, self)
+
+    def read_header(self, lines):
+        """read atom count, energy range, NEDOS and Fermi energy from the first 6 lines"""
+        self.number_of_atoms = int(lines[0].split()[0])
+        info_line = lines[5].split()
+        self.emax = float(info_line[0])
+        self.emin = float(info_line[1])
+        self.nedos = int(info_line[2])
+        self.efermi = float(info_line[3])
+
+    @timed('doscar.parse')
+    def parse(self):
+        """stream DOSCAR block by block into a preallocated array, so that peak
+        memory stays close to the size of the parsed data"""
+        with open(self.filename, 'r') as file:
+            with TRACE.span('doscar.header + total DOS'):
+                self.read_header([file.readline() for _ in range(6)])
+                nedos = self.nedos
+
+                # total DOS: energy, up, down, integrated up, integrated down (ISPIN=1: energy, DOS, integrated)
+                self.total_dos = np.ascontiguousarray(parse_block(islice(file, nedos)).T)
+                self.set_totals()
+
+            # every atom block is a header line followed by nedos lines
+            self.dos = None
+            with TRACE.span('doscar.atom blocks', atoms=self.number_of_atoms, nedos=nedos):
+                for i in range(self.number_of_atoms):
+                    file.readline()
+                    block = parse_block(islice(file, nedos))
+                    if self.dos is None:
+                        self.set_layout(block.shape[1] - 1)
+                        self.dos = np.empty((self.number_of_atoms, len(self.orbitals), self.n_spin, nedos),
+                                            dtype=float)
+                    self.dos[i] = self.block_to_orbitals(block)
+                    self.report(i + 1)
+        self.set_views()
+
+    @timed('doscar.index')
+    def read_index(self):
+        """read header and total DOS, and record where every atom block starts"""
+        with open(self.filename, 'r') as file:
+            self.read_header([file.readline() for _ in range(6)])
+            self.total_dos = np.ascontiguousarray(parse_block(islice(file, self.nedos)).T)
+            self.set_totals()
+            file.readline()
+            self.set_layout(len(file.readline().split()) - 1)
+        headers = [5 + (i + 1) * (self.nedos + 1) for i in range(self.number_of_atoms)]
+        self.block_offsets = np.array(line_offsets(self.filename, headers, progress=self.report_scan), dtype=np.int64)
+
+    def index(self, max_resident=64):
+        self.read_index()
+        self.dos = LazyAtomBlocks(self, self.block_offsets, max_resident)
+        self.set_views()
+
+    @timed('doscar.cache fill')
+    def fill_cache(self, progress=None):
+        """decode every atom of a lazily opened DOSCAR into a new sidecar cache, so
+        the next open is memory-mapped; ``dos`` keeps decoding on demand meanwhile.
+        progress(done, total) is called per atom, an exception raised from it stops
+        the fill and leaves a cache that doscar_cache.load treats as stale"""
+        shape = (self.number_of_atoms, len(self.orbitals), self.n_spin, self.nedos)
+        try:
+            dos = doscar_cache.create(self.filename, shape)
+        except OSError as error:
+            print(f'could not create DOSCAR cache: {error}')
+            return False
+        with open(self.filename, 'rb') as file:
+            for atom, offset in enumerate(self.block_offsets):
+                dos[atom] = self.block_to_orbitals(read_atom_block(file, offset, self.nedos))
+                if progress is not None:
+                    progress(atom + 1, self.number_of_atoms)
+        return doscar_cache.save(self.filename, self, dos)
+
+    @timed('doscar.parse parallel')
+    def parse_parallel(self, workers, in_place=False):
+        """decode atom blocks in a process pool; workers write straight into the
+        cache file (in_place=True) or into shared memory, so only atom counts are
+        sent back"""
+        # multiprocessing is only imported when a parallel parse is asked for
+        from concurrent.futures import ProcessPoolExecutor, as_completed
+        from multiprocessing import shared_memory
+        self.read_index()
+        shape = (self.number_of_atoms, len(self.orbitals), self.n_spin, self.nedos)
+        shm = None
+        target = None
+        if in_place:
+            try:
+                self.dos = doscar_cache.create(self.filename, shape)
+                target = ('npy', self.dos.filename)
+            except OSError as error:
+                print(f'could not create DOSCAR cache, decoding into shared memory: {error}')
+        if target is None:
+            shm = shared_memory.SharedMemory(create=True, size=max(int(np.prod(shape)) * 8, 1))
+            target = ('shm', shm.name, shape)
+        try:
+            chunks = np.array_split(np.arange(self.number_of_atoms), workers * 4)
+            with ProcessPoolExecutor(workers) as pool:
+                futures = [pool.submit(decode_atoms, self.filename, chunk.tolist(), self.block_offsets[chunk],
+                                       self.nedos, len(self.orbitals), self.n_spin, target)
+                           for chunk in chunks if len(chunk)]
+                done = 0
+                try:
+                    for future in as_completed(futures):
+                        done += future.result()
+                        self.report(done)
+                except BaseException:
+                    for future in futures:
+                        future.cancel()  # don't wait for chunks that have not started
+                    raise
+            if shm is not None:
+                shared = np.ndarray(shape, dtype=float, buffer=shm.buf)
+                self.dos = shared.copy()
+                del shared
+        finally:
+            if shm is not None:
+                shm.close()
+                shm.unlink()
+        self.set_views()
+
+    def report(self, done):
+        if self.progress is not None:
+            self.progress(done, self.number_of_atoms, 'atoms parsed')
+
+    def report_scan(self, done, total):
+        if self.progress is not None:
+            self.progress(done >> 20, total >> 20, 'MB indexed')
+
+    @timed('doscar.cache load')
+    def load_cache(self):
+        """take all data from the sidecar cache; returns False if it is missing or stale"""
+        cached = doscar_cache.load(self.filename)
+        if cached is None:
+            return False
+        self.set_data(cached)
+        return True
+
+    @classmethod
+    def from_data(cls, filename, data):
+        """parser holding already decoded data, see set_data"""
+        doscar = cls.__new__(cls)
+        doscar.filename = filename
+        doscar.progress = None
+        doscar.set_data(data)
+        return doscar
+
+    def set_data(self, data):
+        """take header fields, total_dos, n_columns and dos from a dict like the
+        one doscar_cache.load returns; dos can be any per-atom indexable store"""
+        self.number_of_atoms = data['number_of_atoms']
+        self.emax = data['emax']
+        self.emin = data['emin']
+        self.nedos = data['nedos']
+        self.efermi = data['efermi']
+        self.total_dos = data['total_dos']
+        self.set_totals()
+        self.set_layout(data['n_columns'])
+        self.dos = data['dos']
+        self.set_views()
+
+    def set_totals(self):
+        """energy and total DOS per spin; the number of spins follows from the total DOS
+        columns: energy, DOS, integrated DOS for ISPIN=1, both spins of the last two for ISPIN=2"""
+        if len(self.total_dos) not in (3, 5):
+            raise ValueError(f'unsupported DOSCAR layout: {len(self.total_dos)} total DOS columns')
+        self.n_spin = (len(self.total_dos) - 1) // 2
+        self.energy = self.total_dos[0]
+        self.total_dos_energy = self.energy
+        self.total_dos_alfa = self.total_dos[1]
+        self.total_dos_beta = self.total_dos[2] if self.n_spin == 2 else None
+
+    def set_layout(self, n_columns):
+        """set orbital names from the number of projected columns in an atom block"""
+        if n_columns not in ORBITAL_LAYOUTS:
+            raise ValueError(f'unsupported DOSCAR layout: {n_columns} projected columns per atom')
+        element_block, orbitals, orbital_types = ORBITAL_LAYOUTS[n_columns]
+        if len(orbitals) * self.n_spin != n_columns:
+            raise ValueError(f'{n_columns} projected columns per atom do not fit a total DOS with {self.n_spin} spins')
+        self.n_columns = n_columns
+        self.element_block, self.orbitals, self.orbital_types = element_block, orbitals, orbital_types
+
+    def block_to_orbitals(self, block):
+        return block_to_orbitals(block, self.nedos, len(self.orbitals), self.n_spin)
+
+    def set_views(self):
+        if isinstance(self.dos, np.ndarray):
+            self.dataset_up = self.dos[:, :, 0, :]
+            self.dataset_down = self.dos[:, :, 1, :] if self.n_spin == 2 else None
+        else:
+            self.dataset_up = SpinView(self.dos, 0)
+            self.dataset_down = SpinView(self.dos, 1) if self.n_spin == 2 else None
+
+
+def structure_info(poscar):
+    """the POSCAR metadata kept with the DOS: labels, species, counts, cell and positions"""
+    return {'symbol_and_number': poscar.symbol_and_number(), 'list_atomic_symbols': poscar.list_atomic_symbols(),
+            'atomic_symbols': poscar.atomic_symbols(), 'counts': poscar.counts, 'lattice': poscar.lattice,
+            'positions': poscar.cartesian}
+
+
+class VaspData():
+    """DOSCAR and POSCAR of one calculation directory"""
+
+    @timed('vasp.load')
+    def __init__(self, dir, lazy=False, workers=None, progress=None, cache=True):
+        doscar = DOSCARparser(os.path.join(dir, "DOSCAR"), cache=cache, lazy=lazy, workers=workers,
+                              progress=progress)
+        self.set_data(doscar, structure_info(PoscarParser(os.path.join(dir, "POSCAR"))))
+
+    @classmethod
+    def from_parsed(cls, doscar, structure):
+        """VaspData of a parsed DOSCAR and a structure_info dict, e.g. from an export"""
+        data = cls.__new__(cls)
+        data.set_data(doscar, structure)
+        return data
+
+    def set_data(self, doscar, structure):
+        self.doscar = doscar
+        self.structure = structure
+        self.data_up = self.doscar.dataset_up
+        self.data_down = self.doscar.dataset_down
+        self.orbitals = self.doscar.orbitals
+        self.orbital_types = self.doscar.orbital_types
+        self.e_fermi = self.doscar.efermi
+        self.total_alfa = self.doscar.total_dos_alfa
+        self.total_beta = self.doscar.total_dos_beta
+
+        self.atoms_symb_and_num = list(structure['symbol_and_number'])
+        self.number_of_atoms = len(self.atoms_symb_and_num)
+        self.list_atomic_symbols = list(structure['list_atomic_symbols'])
+        self.atomic_symbols = list(structure['atomic_symbols'])
 
 
 if __name__ == "__main__":
     doscar = DOSCARparser("D:\\OneDrive - Uniwersytet Jagielloński\\modelowanie DFT\\czasteczki\\O2\\DOSCAR")
     poscar = PoscarParser("D:\\OneDrive - Uniwersytet Jagielloński\\modelowanie DFT\\czasteczki\\O2\\POSCAR")
     print(doscar.number_of_atoms == poscar.number_of_atoms())
-    print(doscar.element_block)
\ No newline at end of file
+    print(doscar.element_block)
+
@@ -0,0 +1,62 @@
+import numpy as np
+from PyQt5 import QtCore
+
+
+class AtomListModel(QtCore.QAbstractListModel):
+    """checkable atom labels for a QListView, backed by a boolean mask
+
+    the view only creates what is visible, so thousands of atoms cost no
+    widgets; ``mask`` is the selection and set_checked() changes many rows with
+    one vectorised assignment and a single dataChanged / selection_changed
+    """
+    selection_changed = QtCore.pyqtSignal()
+
+    def __init__(self, labels=(), parent=None):
+        super().__init__(parent)
+        self.labels = np.asarray(labels, dtype=str)
+        self.mask = np.zeros(len(self.labels), dtype=bool)
+
+    def set_labels(self, labels):
+        """new atoms, all unchecked"""
+        self.beginResetModel()
+        self.labels = np.asarray(labels, dtype=str)
+        self.mask = np.zeros(len(self.labels), dtype=bool)
+        self.endResetModel()
+        self.selection_changed.emit()
+
+    def rowCount(self, parent=QtCore.QModelIndex()):
+        return 0 if parent.isValid() else len(self.labels)
+
+    def data(self, index, role=QtCore.Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        if role == QtCore.Qt.DisplayRole:
+            return str(self.labels[index.row()])
+        if role == QtCore.Qt.CheckStateRole:
+            return QtCore.Qt.Checked if self.mask[index.row()] else QtCore.Qt.Unchecked
+        return None
+
+    def flags(self, index):
+        return QtCore.Qt.ItemIsEnabled | QtCore.Qt.ItemIsSelectable | QtCore.Qt.ItemIsUserCheckable
+
+    def setData(self, index, value, role=QtCore.Qt.EditRole):
+        if role != QtCore.Qt.CheckStateRole or not index.isValid():
+            return False
+        self.mask[index.row()] = value == QtCore.Qt.Checked
+        self.dataChanged.emit(index, index, [QtCore.Qt.CheckStateRole])
+        self.selection_changed.emit()
+        return True
+
+    def set_checked(self, rows, check):
+        """check or uncheck rows given as indices or a boolean mask"""
+        self.mask[rows] = check
+        if len(self.labels):
+            self.dataChanged.emit(self.index(0), self.index(len(self.labels) - 1), [QtCore.Qt.CheckStateRole])
+        self.selection_changed.emit()
+
+    def set_checked_labels(self, labels, check):
+        """check or uncheck every atom whose label is in ``labels``"""
+        self.set_checked(np.isin(self.labels, list(labels)), check)
+
+    def checked(self):
+        return np.flatnonzero(self.mask)
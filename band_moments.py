@@ -0,0 +1,98 @@
+import numpy as np
+from merged_dos import ATOM_BATCH, take_atoms
+from instrumentation import timed
+
+MOMENT_FIELDS = [('norm', float), ('occupation', float), ('filling', float), ('centre', float),
+                 ('width', float), ('skewness', float), ('kurtosis', float)]
+
+
+def trapezoid_weights(energy):
+    """w such that values @ w is the trapezoidal integral of values over energy"""
+    steps = np.diff(np.asarray(energy, dtype=float))
+    weights = np.zeros(len(energy))
+    weights[:-1] += steps / 2
+    weights[1:] += steps / 2
+    return weights
+
+
+def moment_matrix(energy, efermi, window=None):
+    """(nedos, 6) matrix whose columns integrate x**0 .. x**4 and the occupation
+    below the Fermi level, with x = E - efermi; window=(low, high) relative to
+    efermi limits the integration range"""
+    x = np.asarray(energy, dtype=float) - efermi
+    weights = trapezoid_weights(energy)
+    if window is not None:
+        weights = np.where((x >= window[0]) & (x <= window[1]), weights, 0.0)
+    columns = [weights * x ** k for k in range(5)] + [np.where(x <= 0, weights, 0.0)]
+    return np.stack(columns, axis=1)
+
+
+def moments_from_integrals(integrals):
+    """moments from the (..., 6) products with moment_matrix, see moments()"""
+    norm = integrals[..., 0]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        m1, m2, m3, m4 = (integrals[..., k] / norm for k in range(1, 5))
+        variance = m2 - m1 ** 2
+        mu3 = m3 - 3 * m1 * m2 + 2 * m1 ** 3
+        mu4 = m4 - 4 * m1 * m3 + 6 * m1 ** 2 * m2 - 3 * m1 ** 4
+        width = np.sqrt(np.maximum(variance, 0.0))
+        return {'norm': norm, 'occupation': integrals[..., 5], 'filling': integrals[..., 5] / norm,
+                'centre': m1, 'width': width, 'skewness': mu3 / width ** 3, 'kurtosis': mu4 / variance ** 2}
+
+
+def moments(curves, energy, efermi, window=None):
+    """moments of (..., nedos) curves over energy, all in one matrix product
+
+    returns a dict of (...) arrays: norm (0th moment), occupation (integral up
+    to efermi), filling (occupation / norm), centre (relative to efermi),
+    width (standard deviation), skewness and kurtosis; empty curves give nan
+    """
+    return moments_from_integrals(np.asarray(curves, dtype=float) @ moment_matrix(energy, efermi, window))
+
+
+def shell_groups(orbitals, orbital_types):
+    """[(shell name, orbital indices)] from DOSCARparser.orbitals / orbital_types,
+    e.g. [('s', [0]), ('p', [1, 2, 3]), ('d', [4, ..., 8])]"""
+    groups = []
+    for shell in orbital_types:
+        name = shell[0] if len(shell) == 1 else shell[0][0]
+        groups.append((name, [orbitals.index(orbital) for orbital in shell]))
+    return groups
+
+
+@timed('band_table')
+def band_table(dos, energy, efermi, groups, atom_labels=None, window=None):
+    """moments of every atom x orbital group x spin as one structured array
+
+    dos is DOSCARparser.dos (array, memmap or LazyAtomBlocks); groups is a list
+    of (name, orbital indices) whose orbitals are summed first, see
+    shell_groups, so ('d', [4, ..., 8]) gives d-band centres. atoms are
+    processed ATOM_BATCH at a time
+    """
+    n_atoms = len(dos)
+    n_orbitals, n_spin = dos[0].shape[:2]
+    if atom_labels is None:
+        atom_labels = [str(atom + 1) for atom in range(n_atoms)]
+    names = [name for name, _ in groups]
+    grouping = np.zeros((len(groups), n_orbitals))
+    for g, (_, orbitals) in enumerate(groups):
+        grouping[g, orbitals] = 1.0
+    matrix = moment_matrix(energy, efermi, window)
+
+    integrals = np.empty((n_atoms, len(groups), n_spin, matrix.shape[1]))
+    atoms = np.arange(n_atoms)
+    for start in range(0, n_atoms, ATOM_BATCH):
+        batch = take_atoms(dos, atoms[start:start + ATOM_BATCH], np.arange(n_orbitals))
+        # integrate first, then sum orbitals: both are linear and this way round is cheaper
+        integrals[start:start + ATOM_BATCH] = np.einsum('go,aosk->agsk', grouping, batch @ matrix)
+
+    result = moments_from_integrals(integrals)
+    table = np.zeros(integrals.shape[:3], dtype=[('atom', int), ('label', 'U16'), ('shell', 'U8'),
+                                                 ('spin', 'U4')] + MOMENT_FIELDS)
+    table['atom'] = atoms[:, None, None]
+    table['label'] = np.asarray(atom_labels, dtype='U16')[:, None, None]
+    table['shell'] = np.asarray(names, dtype='U8')[None, :, None]
+    table['spin'] = np.array(['up', 'down'][:n_spin])[None, None, :]
+    for field, _ in MOMENT_FIELDS:
+        table[field] = result[field]
+    return table.ravel()
@@ -0,0 +1,251 @@
+"""benchmarks of parsing, merging and plotting on synthetic VASP runs
+
+    python benchmark.py                                # small and medium runs
+    python benchmark.py -s 256x3000:f -s large --save  # also writes benchmark_results/<time>-<commit>.json
+    python benchmark.py --compare benchmark_results/old.json
+
+a size is a preset name (see SIZES) or ATOMSxNEDOS[:LAYOUT[:SPIN]], e.g.
+64x3000:d or 64x3000:d:1. every case is timed ``repeat`` times (best and
+median wall time) and run once more under tracemalloc for its peak memory,
+which covers Python and NumPy allocations but not Qt's. runs are generated by
+synthetic_vasp into a temporary directory, or kept in --keep DIR and reused
+from there
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from functools import lru_cache
+import numpy as np
+import synthetic_vasp
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+RESULTS = os.path.join(HERE, 'benchmark_results')
+
+# name -> (atoms, nedos, layout, spin)
+SIZES = {'small': (12, 301, 'd', 2), 'medium': (128, 2000, 'd', 2), 'large': (400, 3000, 'f', 2)}
+
+
+def parse_size(size):
+    """(label, atoms, nedos, layout, spin) of a preset name or ATOMSxNEDOS[:LAYOUT[:SPIN]]"""
+    if size in SIZES:
+        atoms, nedos, layout, spin = SIZES[size]
+    else:
+        dimensions, _, rest = size.partition(':')
+        layout, _, spin = rest.partition(':')
+        try:
+            atoms, nedos = (int(value) for value in dimensions.lower().split('x'))
+            spin = int(spin or 2)
+        except ValueError:
+            raise ValueError(f'bad size {size!r}, use one of {", ".join(SIZES)} or ATOMSxNEDOS[:LAYOUT[:SPIN]]')
+        layout = layout or 'd'
+    return f'{atoms}x{nedos}:{layout}:{spin}', atoms, nedos, layout, spin
+
+
+def measure(func, repeat):
+    """best and median wall time in seconds and tracemalloc peak in MB of func()"""
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    tracemalloc.start()
+    try:
+        func()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return {'best_s': min(times), 'median_s': statistics.median(times), 'peak_mb': peak / 2 ** 20}
+
+
+# every case takes the run directory and returns the function to time
+
+def case_doscar(directory):
+    from VASPparser import DOSCARparser
+    return lambda: DOSCARparser(os.path.join(directory, 'DOSCAR'))
+
+
+def case_doscar_lazy(directory):
+    from VASPparser import DOSCARparser
+    return lambda: DOSCARparser(os.path.join(directory, 'DOSCAR'), lazy=True)
+
+
+def case_doscar_cache(directory):
+    import doscar_cache
+    from VASPparser import DOSCARparser
+    filename = os.path.join(directory, 'DOSCAR')
+    doscar_cache.save(filename, DOSCARparser(filename))
+    return lambda: DOSCARparser(filename, cache=True)
+
+
+def case_poscar(directory):
+    from VASPparser import PoscarParser
+    return lambda: PoscarParser(os.path.join(directory, 'POSCAR'))
+
+
+def case_outcar(directory):
+    from VASPparser import OutcarParser
+
+    def parse():
+        outcar = OutcarParser(os.path.join(directory, 'OUTCAR'))
+        outcar.magnetization()
+    return parse
+
+
+def case_merge_sum(directory):
+    from VASPparser import DOSCARparser
+    from merged_dos import merge_sum
+    dos = DOSCARparser(os.path.join(directory, 'DOSCAR')).dos
+    atoms, orbitals = np.arange(dos.shape[0]), np.arange(dos.shape[1])
+    return lambda: merge_sum(dos, atoms, orbitals)
+
+
+@lru_cache(maxsize=None)
+def main_window(directory, timeout=600):
+    """offscreen MainWindow with ``directory`` loaded and everything selected,
+    one per directory"""
+    os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+    from PyQt5.QtWidgets import QApplication
+    import DOSwizard_main
+    app = QApplication.instance() or QApplication([])
+    window = DOSwizard_main.MainWindow(directory)
+    errors = []
+    window.loader.failed.connect(errors.append)
+    window.show()
+    start = time.perf_counter()
+    while window.data is None or window.data.doscar.filename != os.path.join(directory, 'DOSCAR'):
+        if errors:
+            window.close()
+            raise RuntimeError(errors[0])
+        if time.perf_counter() - start > timeout:
+            raise TimeoutError(f'{directory} not loaded after {timeout} s')
+        app.processEvents()
+    window.select_all_atoms()
+    window.select_all_orbitals()
+    window.plot_scheduler.flush()
+    return app, window
+
+
+def plot_case(batched):
+    def case(directory):
+        app, window = main_window(directory)
+        window.param.param('Batch curves').setValue(batched)
+        window.plot_scheduler.flush()
+
+        def plot():
+            window.update_plot()
+            app.processEvents()
+        return plot
+    return case
+
+
+CASES = {'doscar': case_doscar, 'doscar_lazy': case_doscar_lazy, 'doscar_cache': case_doscar_cache,
+         'poscar': case_poscar, 'outcar': case_outcar, 'merge_sum': case_merge_sum,
+         'update_plot': plot_case(True), 'update_plot_unbatched': plot_case(False)}
+
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=HERE, capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+def run(sizes, cases, repeat=3, keep=None, steps=10):
+    """list of result dicts, one per size x case; a failing case records its error"""
+    results = []
+    with tempfile.TemporaryDirectory() as scratch:
+        for size in sizes:
+            label, atoms, nedos, layout, spin = parse_size(size)
+            directory = os.path.join(keep or scratch, label.replace(':', '_'))
+            if not os.path.exists(os.path.join(directory, 'OUTCAR')):
+                print(f'writing {label} run to {directory}', flush=True)
+                synthetic_vasp.write_run(directory, atoms, nedos, layout, spin, steps)
+            for name in cases:
+                result = {'case': name, 'size': label}
+                try:
+                    result.update(measure(CASES[name](directory), repeat))
+                except Exception as error:
+                    result['error'] = f'{type(error).__name__}: {error}'
+                results.append(result)
+                print(format_result(result), flush=True)
+    return results
+
+
+def format_result(result, baseline=None):
+    line = f'{result["case"]:24s} {result["size"]:18s}'
+    if 'error' in result:
+        return line + f' {result["error"]}'
+    line += f' {1000 * result["best_s"]:10.1f} ms {1000 * result["median_s"]:10.1f} ms {result["peak_mb"]:9.1f} MB'
+    if baseline is not None and 'error' not in baseline:
+        line += f'  x{result["best_s"] / baseline["best_s"]:.2f} time  x{result["peak_mb"] / max(baseline["peak_mb"], 1e-6):.2f} memory'
+    return line
+
+
+def compare(results, baseline, threshold=1.25):
+    """print every result next to its baseline; returns the cases that got slower
+    or use more memory than ``threshold`` times the baseline"""
+    previous = {(entry['case'], entry['size']): entry for entry in baseline['results']}
+    regressions = []
+    print(f'\ncompared to {baseline["meta"]["revision"]} of {baseline["meta"]["time"]}:')
+    for result in results:
+        before = previous.get((result['case'], result['size']))
+        print(format_result(result, before))
+        if before is None or 'error' in result or 'error' in before:
+            continue
+        # sub-millisecond cases are mostly timer noise
+        slower = result['best_s'] > threshold * before['best_s'] and result['best_s'] - before['best_s'] > 1e-3
+        if slower or result['peak_mb'] > threshold * before['peak_mb']:
+            regressions.append(result)
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='time parsers, merging and plotting on synthetic VASP runs')
+    parser.add_argument('-s', '--size', action='append',
+                        help=f'{", ".join(SIZES)} or ATOMSxNEDOS[:LAYOUT[:SPIN]]; may be repeated (default small, medium)')
+    parser.add_argument('-c', '--case', action='append', choices=list(CASES), help='may be repeated (default all)')
+    parser.add_argument('-n', '--repeat', type=int, default=3)
+    parser.add_argument('--steps', type=int, default=10, help='ionic steps in the synthetic OUTCAR')
+    parser.add_argument('--keep', help='write the synthetic runs here and reuse them next time')
+    parser.add_argument('--save', nargs='?', const='', help='write results as JSON, by default to benchmark_results/')
+    parser.add_argument('--compare', help='JSON of an earlier run; exit code 1 on a regression')
+    parser.add_argument('--threshold', type=float, default=1.25, help='slowdown counted as regression (default 1.25)')
+    args = parser.parse_args(argv)
+
+    sizes = args.size or ['small', 'medium']
+    for size in sizes:
+        try:
+            parse_size(size)
+        except ValueError as error:
+            parser.error(str(error))
+    meta = {'revision': git_revision(), 'time': time.strftime('%Y-%m-%dT%H:%M:%S'), 'python': platform.python_version(),
+            'numpy': np.__version__, 'machine': platform.machine(), 'platform': platform.platform(),
+            'repeat': args.repeat}
+    print(f'{"case":24s} {"size":18s} {"best":>13s} {"median":>13s} {"peak":>12s}')
+    results = run(sizes, args.case or list(CASES), args.repeat, args.keep, args.steps)
+
+    if args.save is not None:
+        filename = args.save or os.path.join(RESULTS, f'{time.strftime("%Y%m%d-%H%M%S")}-{meta["revision"]}.json')
+        os.makedirs(os.path.dirname(os.path.abspath(filename)), exist_ok=True)
+        with open(filename, 'w') as file:
+            json.dump({'meta': meta, 'results': results}, file, indent=1)
+        print(f'results written to {filename}')
+    if args.compare:
+        with open(args.compare) as file:
+            regressions = compare(results, json.load(file), args.threshold)
+        if regressions:
+            print(f'{len(regressions)} regressions over x{args.threshold}', file=sys.stderr)
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,133 @@
+from collections import OrderedDict
+import numpy as np
+from instrumentation import TRACE, held_bytes, timed
+from merged_dos import ATOM_BATCH, take_atoms
+
+KERNELS = ('none', 'gaussian', 'lorentzian', 'voigt')
+
+
+def grid_step(energy):
+    """spacing of a uniform energy grid; DOSCAR energies are rounded when
+    written, so they only have to lie within 10 % of a step of the grid"""
+    energy = np.asarray(energy, dtype=float)
+    step = (energy[-1] - energy[0]) / (len(energy) - 1)
+    if step <= 0 or np.abs(energy - np.linspace(energy[0], energy[-1], len(energy))).max() > 0.1 * step:
+        raise ValueError('broadening needs a uniform, ascending energy grid')
+    return step
+
+
+def kernel_spectrum(n_fft, step, kind, sigma=0.0, gamma=0.0):
+    """Fourier transform of a unit-area kernel centred at zero, sampled for an
+    rfft of length n_fft: gaussian (standard deviation sigma), lorentzian
+    (half width gamma) or voigt, the product of both"""
+    if kind not in KERNELS:
+        raise ValueError(f'unknown broadening kernel: {kind}')
+    omega = 2 * np.pi * np.fft.rfftfreq(n_fft, d=step)
+    spectrum = np.ones_like(omega)
+    if kind in ('gaussian', 'voigt'):
+        spectrum *= np.exp(-0.5 * (sigma * omega) ** 2)
+    if kind in ('lorentzian', 'voigt'):
+        spectrum *= np.exp(-gamma * np.abs(omega))
+    return spectrum
+
+
+def broaden(values, energy, kind='gaussian', sigma=0.0, gamma=0.0):
+    """convolve ``values`` (..., nedos) with the kernel along the last axis
+
+    one rfft / irfft pair over the whole batch; the signal is zero-padded to
+    twice its length so the kernel tails do not wrap around. the kernel has unit
+    area, so the integral is kept for features well inside the energy window;
+    the part of the kernel reaching past either end of the grid is cut off, and
+    curves with weight near the window edges lose that much (not renormalised)
+    """
+    values = np.asarray(values, dtype=float)
+    nedos = values.shape[-1]
+    n_fft = 2 * nedos
+    spectrum = kernel_spectrum(n_fft, grid_step(energy), kind, sigma, gamma)
+    return np.fft.irfft(np.fft.rfft(values, n_fft) * spectrum, n_fft)[..., :nedos]
+
+
+class BroadenedBlocks:
+    """per-atom store like LazyAtomBlocks whose atoms are broadened on access,
+    for one-off passes over all atoms (band moments) without a broadened copy
+    of the whole cube"""
+
+    def __init__(self, dos, energy, key):
+        self.dos = dos
+        self.energy = energy
+        self.key = key
+
+    def __len__(self):
+        return len(self.dos)
+
+    def __getitem__(self, atom):
+        return broaden(self.dos[atom], self.energy, *self.key)
+
+    def __iter__(self):
+        for atom in range(len(self)):
+            yield self[atom]
+
+
+class Broadener:
+    """broadened projected DOS of the atoms and orbitals that are drawn
+
+    select() broadens only the selected atoms x orbitals, in batches of
+    ATOM_BATCH atoms, and caches the result per kernel, width and selection;
+    the least recently used results are dropped once the cache holds more than
+    ``max_bytes``, so going back to a width that was already shown costs nothing
+    and the full cube is never copied
+    """
+
+    def __init__(self, dos, energy, max_bytes=256 * 2 ** 20):
+        self.dos = dos
+        self.energy = np.asarray(energy, dtype=float)
+        self.max_bytes = max_bytes
+        self.cache = OrderedDict()
+
+    @staticmethod
+    def key(kind, sigma, gamma):
+        if kind == 'none' or (kind == 'gaussian' and sigma <= 0) or (kind == 'lorentzian' and gamma <= 0) \
+                or (kind == 'voigt' and sigma <= 0 and gamma <= 0):
+            return None
+        return kind, float(sigma), float(gamma)
+
+    @timed('broaden selection')
+    def select(self, atoms, orbitals, kind='none', sigma=0.0, gamma=0.0):
+        """(atoms, orbitals, n_spin, nedos) broadened DOS of the selection, the
+        original one for kind='none' or zero width"""
+        atoms = np.asarray(atoms, dtype=int).ravel()
+        orbitals = np.asarray(orbitals, dtype=int).ravel()
+        key = self.key(kind, sigma, gamma)
+        if len(atoms) == 0:
+            return np.zeros((0, len(orbitals)) + self.dos[0].shape[1:])
+        if key is None:
+            return take_atoms(self.dos, atoms, orbitals)
+        selection = key + (atoms.tobytes(), orbitals.tobytes())
+        if selection in self.cache:
+            self.cache.move_to_end(selection)
+            return self.cache[selection]
+        result = np.empty((len(atoms), len(orbitals)) + self.dos[0].shape[1:], dtype=float)
+        for start in range(0, len(atoms), ATOM_BATCH):
+            batch = take_atoms(self.dos, atoms[start:start + ATOM_BATCH], orbitals)
+            result[start:start + ATOM_BATCH] = broaden(batch, self.energy, *key)
+        result.flags.writeable = False
+        self.cache[selection] = result
+        while len(self.cache) > 1 and held_bytes(self.cache) > self.max_bytes:
+            self.cache.popitem(last=False)
+        TRACE.count('bytes broadened DOS', held_bytes(self.cache))
+        return result
+
+    def pdos(self, kind='none', sigma=0.0, gamma=0.0):
+        """all atoms, e.g. for band moments: the original DOS for kind='none' or
+        zero width, otherwise BroadenedBlocks, broadened atom by atom and not cached"""
+        key = self.key(kind, sigma, gamma)
+        if key is None:
+            return self.dos
+        return BroadenedBlocks(self.dos, self.energy, key)
+
+    def apply(self, values, kind='none', sigma=0.0, gamma=0.0):
+        """broaden any (..., nedos) curves on the same grid, e.g. total or merged DOS"""
+        key = self.key(kind, sigma, gamma)
+        if key is None:
+            return np.asarray(values)
+        return broaden(values, self.energy, *key)
@@ -0,0 +1,83 @@
+import functools
+import threading
+import time
+import traceback
+from PyQt5 import QtCore
+
+
+class LoadCancelled(Exception):
+    pass
+
+
+class DataLoader(QtCore.QObject):
+    """runs ``load(directory, progress)`` in its own QThread
+
+    progress(done, total, what) is handed to the parser and forwarded as console
+    messages; cancel() makes the next progress call raise LoadCancelled, so the
+    parse stops at the next atom block or index chunk. the short steps without
+    progress calls (header, total DOS, cache check, POSCAR) still run to the end.
+    results of a cancelled load are dropped.
+    ``finish(data, progress)``, if given, runs in the same thread after the
+    data is sent, for work the GUI need not wait for (e.g. filling a cache)
+    """
+    message = QtCore.pyqtSignal(str)
+    loaded = QtCore.pyqtSignal(object)
+    failed = QtCore.pyqtSignal(str)
+    done = QtCore.pyqtSignal()
+
+    def __init__(self, directory, load, finish=None, parent=None):
+        super().__init__(parent)
+        self.directory = directory
+        self.load = load
+        self.finish = finish
+        self.cancelled = False
+        self.reported = None
+        self.thread = QtCore.QThread()
+        self.moveToThread(self.thread)
+        self.thread.started.connect(self.run)
+        # direct: the GUI thread may be blocked in thread.wait()
+        self.done.connect(self.thread.quit, QtCore.Qt.DirectConnection)
+
+    def start(self):
+        self.thread.start()
+
+    def cancel(self):
+        self.cancelled = True
+
+    def progress(self, done, total, what='atoms parsed'):
+        if self.cancelled:
+            raise LoadCancelled()
+        # one message per 10 % (of every kind of progress) is enough for the console
+        step = (what, done * 10 // max(total, 1))
+        if step != self.reported:
+            self.reported = step
+            self.message.emit(f'{done}/{total} {what}')
+
+    def run(self):
+        threading.current_thread().name = 'loader'  # shown in exported traces
+        start = time.perf_counter()
+        self.message.emit(f'loading {self.directory}')
+        try:
+            data = self.load(self.directory, self.progress)
+        except LoadCancelled:
+            self.message.emit(f'loading {self.directory} cancelled')
+        except Exception as error:
+            traceback.print_exc()
+            if not self.cancelled:
+                self.failed.emit(f'could not load {self.directory}: {error}')
+        else:
+            if not self.cancelled:
+                self.message.emit(f'loaded {self.directory} in {time.perf_counter() - start:.1f} s')
+                self.loaded.emit(data)
+                if self.finish is not None:
+                    self.run_finish(data)
+        self.done.emit()
+
+    def run_finish(self, data):
+        try:
+            self.finish(data, functools.partial(self.progress, what='atoms cached'))
+        except LoadCancelled:
+            self.message.emit(f'caching {self.directory} cancelled')
+        except Exception as error:
+            traceback.print_exc()
+            self.message.emit(f'could not cache {self.directory}: {error}')
@@ -0,0 +1,177 @@
+"""export of the full projected DOS to HDF5 or Parquet, and reading it back
+
+both formats are laid out along the atom axis: HDF5 chunks and Parquet row
+groups hold ``atoms_per_chunk`` atoms each, so one atom is read without
+decompressing the rest. h5py and pyarrow are only imported when used
+"""
+import json
+from collections import OrderedDict
+import numpy as np
+from VASPparser import ORBITAL_LAYOUTS, DOSCARparser, VaspData
+from merged_dos import take_atoms
+from instrumentation import timed
+
+EXPORT_VERSION = 1
+HDF5_SUFFIXES = ('.h5', '.hdf5')
+PARQUET_SUFFIXES = ('.parquet', '.pq')
+HEADER_FIELDS = ('number_of_atoms', 'emax', 'emin', 'nedos', 'efermi', 'n_columns')
+
+
+def is_export(filename):
+    return filename.lower().endswith(HDF5_SUFFIXES + PARQUET_SUFFIXES)
+
+
+@timed('export')
+def export(data, filename, compression=None, atoms_per_chunk=1):
+    """write a VaspData to ``filename``, HDF5 or Parquet by suffix"""
+    if filename.lower().endswith(HDF5_SUFFIXES):
+        export_hdf5(data, filename, compression or 'gzip', atoms_per_chunk)
+    elif filename.lower().endswith(PARQUET_SUFFIXES):
+        export_parquet(data, filename, compression or 'zstd', atoms_per_chunk)
+    else:
+        raise ValueError(f'unknown export format: {filename} (use {", ".join(HDF5_SUFFIXES + PARQUET_SUFFIXES)})')
+
+
+def header(doscar):
+    return {field: getattr(doscar, field) for field in HEADER_FIELDS}
+
+
+def atom_chunks(dos, atoms_per_chunk):
+    """(start, (k, n_orbitals, n_spin, nedos) array) for consecutive atom chunks"""
+    orbitals = np.arange(dos[0].shape[0])
+    for start in range(0, len(dos), atoms_per_chunk):
+        yield start, take_atoms(dos, np.arange(start, min(start + atoms_per_chunk, len(dos))), orbitals)
+
+
+def export_hdf5(data, filename, compression='gzip', atoms_per_chunk=1):
+    """datasets energy, total_dos and pdos (n_atoms, n_orbitals, n_spin, nedos)
+    chunked by atoms, with shuffle + compression; POSCAR data under structure/"""
+    import h5py
+    doscar = data.doscar
+    shape = (doscar.number_of_atoms, len(doscar.orbitals), doscar.n_spin, doscar.nedos)
+    with h5py.File(filename, 'w') as file:
+        file.attrs['version'] = EXPORT_VERSION
+        for field, value in header(doscar).items():
+            file.attrs[field] = value
+        file.create_dataset('energy', data=doscar.energy)
+        file.create_dataset('total_dos', data=doscar.total_dos)
+        chunks = (min(atoms_per_chunk, shape[0]),) + shape[1:]
+        pdos = file.create_dataset('pdos', shape=shape, dtype=float, chunks=chunks, compression=compression,
+                                   shuffle=compression is not None)
+        for start, chunk in atom_chunks(doscar.dos, atoms_per_chunk):
+            pdos[start:start + len(chunk)] = chunk
+        structure = file.create_group('structure')
+        for name, value in data.structure.items():
+            if name in ('symbol_and_number', 'list_atomic_symbols', 'atomic_symbols'):
+                structure.create_dataset(name, data=np.array(value, dtype=h5py.string_dtype()))
+            else:
+                structure.create_dataset(name, data=np.asarray(value))
+
+
+def export_parquet(data, filename, compression='zstd', atoms_per_chunk=1):
+    """one row per atom x orbital x spin with the curve as a fixed size list;
+    row groups hold atoms_per_chunk atoms, header, energies, total DOS and POSCAR
+    data go to the schema metadata"""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    doscar = data.doscar
+    n_orbitals, n_spin = len(doscar.orbitals), doscar.n_spin
+    meta = dict(header(doscar), version=EXPORT_VERSION, atoms_per_chunk=atoms_per_chunk,
+                total_dos=np.asarray(doscar.total_dos).tolist(),
+                structure={name: np.asarray(value).tolist() for name, value in data.structure.items()})
+    schema = pa.schema([('atom', pa.int32()), ('orbital', pa.string()), ('spin', pa.int8()),
+                        ('dos', pa.list_(pa.float64(), doscar.nedos))],
+                       metadata={'doswizard': json.dumps(meta)})
+    with pq.ParquetWriter(filename, schema, compression=compression) as writer:
+        for start, chunk in atom_chunks(doscar.dos, atoms_per_chunk):
+            atoms = np.repeat(np.arange(start, start + len(chunk)), n_orbitals * n_spin)
+            orbitals = np.tile(np.repeat(doscar.orbitals, n_spin), len(chunk))
+            spins = np.tile(np.arange(n_spin), len(chunk) * n_orbitals)
+            values = pa.FixedSizeListArray.from_arrays(pa.array(np.ascontiguousarray(chunk).ravel()), doscar.nedos)
+            writer.write_table(pa.Table.from_arrays([pa.array(atoms, pa.int32()), pa.array(orbitals),
+                                                     pa.array(spins, pa.int8()), values], schema=schema))
+
+
+class StoredAtomBlocks:
+    """per-atom projected DOS of an exported file, read one chunk at a time
+
+    ``blocks[atom]`` returns a (n_orbitals, n_spin, nedos) array like
+    LazyAtomBlocks; the last ``max_resident`` atoms worth of chunks are kept.
+    ``source`` is the open file, kept alive as long as the blocks
+    """
+
+    def __init__(self, n_atoms, atoms_per_chunk, read_chunk, max_resident=64, source=None):
+        self.source = source
+        self.n_atoms = n_atoms
+        self.atoms_per_chunk = atoms_per_chunk
+        self.read_chunk = read_chunk
+        self.max_chunks = max(1, max_resident // atoms_per_chunk)
+        self.resident = OrderedDict()
+
+    def __len__(self):
+        return self.n_atoms
+
+    def __getitem__(self, atom):
+        atom = range(len(self))[atom]
+        chunk, row = divmod(atom, self.atoms_per_chunk)
+        if chunk in self.resident:
+            self.resident.move_to_end(chunk)
+        else:
+            block = self.read_chunk(chunk)
+            block.flags.writeable = False
+            self.resident[chunk] = block
+            while len(self.resident) > self.max_chunks:
+                self.resident.popitem(last=False)
+        return self.resident[chunk][row]
+
+    def __iter__(self):
+        for atom in range(len(self)):
+            yield self[atom]
+
+
+@timed('export.load')
+def load(filename, max_resident=64):
+    """VaspData of an exported file; only header, total DOS and POSCAR data are
+    read here, atoms are read on first access"""
+    if filename.lower().endswith(HDF5_SUFFIXES):
+        return load_hdf5(filename, max_resident)
+    if filename.lower().endswith(PARQUET_SUFFIXES):
+        return load_parquet(filename, max_resident)
+    raise ValueError(f'unknown export format: {filename}')
+
+
+def load_hdf5(filename, max_resident=64):
+    import h5py
+    file = h5py.File(filename, 'r')  # stays open while the blocks are in use
+    pdos = file['pdos']
+    atoms_per_chunk = pdos.chunks[0] if pdos.chunks else 1
+
+    def read_chunk(chunk):
+        return pdos[chunk * atoms_per_chunk:(chunk + 1) * atoms_per_chunk]
+
+    data = {field: file.attrs[field].item() for field in HEADER_FIELDS}
+    data['total_dos'] = file['total_dos'][...]
+    data['dos'] = StoredAtomBlocks(pdos.shape[0], atoms_per_chunk, read_chunk, max_resident, file)
+    structure = {}
+    for name, dataset in file['structure'].items():
+        structure[name] = dataset.asstr()[...].tolist() if h5py.check_string_dtype(dataset.dtype) else dataset[...]
+    return VaspData.from_parsed(DOSCARparser.from_data(filename, data), structure)
+
+
+def load_parquet(filename, max_resident=64):
+    import pyarrow.parquet as pq
+    file = pq.ParquetFile(filename)
+    meta = json.loads(file.schema_arrow.metadata[b'doswizard'])
+    n_orbitals = len(ORBITAL_LAYOUTS[meta['n_columns']][1])
+    n_spin = meta['n_columns'] // n_orbitals
+
+    def read_chunk(chunk):
+        values = file.read_row_group(chunk, columns=['dos']).column('dos').combine_chunks()
+        return values.flatten().to_numpy().reshape(-1, n_orbitals, n_spin, meta['nedos'])
+
+    data = {field: meta[field] for field in HEADER_FIELDS}
+    data['total_dos'] = np.array(meta['total_dos'])
+    data['dos'] = StoredAtomBlocks(meta['number_of_atoms'], meta['atoms_per_chunk'], read_chunk, max_resident, file)
+    structure = {name: np.array(value) if name in ('counts', 'lattice', 'positions') else value
+                 for name, value in meta['structure'].items()}
+    return VaspData.from_parsed(DOSCARparser.from_data(filename, data), structure)
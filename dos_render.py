@@ -0,0 +1,172 @@
+import numpy as np
+import pyqtgraph as pg
+from PyQt5 import QtCore, QtGui
+from instrumentation import TRACE
+
+# spin down is drawn to the left of the energy axis
+SPIN_SIGNS = np.array([1.0, -1.0])
+
+
+def pack_curves(curves, energy):
+    """join (n_curves, nedos) DOS curves into single x, y arrays plus a connect
+    array that breaks the line between consecutive curves"""
+    curves = np.asarray(curves, dtype=float).reshape(-1, len(energy))
+    n_curves, nedos = curves.shape
+    x = curves.ravel()
+    y = np.tile(np.asarray(energy, dtype=float), n_curves)
+    connect = np.ones(n_curves * nedos, dtype=bool)
+    connect[nedos - 1::nedos] = False
+    return x, y, connect
+
+
+def mirror_spins(dos):
+    """(n_curves, nedos) curves of a (..., n_spin, nedos) DOS as plotted: all spin
+    up curves, then the spin down ones negated; ISPIN=1 data has only the first"""
+    dos = np.asarray(dos, dtype=float)
+    by_spin = np.moveaxis(dos, -2, 0).reshape(dos.shape[-2], -1, dos.shape[-1])
+    return (by_spin * SPIN_SIGNS[:len(by_spin), None, None]).reshape(-1, dos.shape[-1])
+
+
+def minmax_decimate(curves, energy, low, high, n_bins):
+    """reduce (n_curves, nedos) curves to the energy window [low, high] with at
+    most ``n_bins`` bins, keeping the minimum and maximum of every bin so peaks
+    survive; returns (curves, energy) with 2 points per bin, or the plain window
+    if it is already that small. ``energy`` must be ascending"""
+    start = max(np.searchsorted(energy, low) - 1, 0)
+    stop = min(np.searchsorted(energy, high, side='right') + 1, len(energy))
+    curves = curves[:, start:stop]
+    energy = energy[start:stop]
+    if stop - start <= 2 * n_bins:
+        return curves, energy
+    starts = np.linspace(0, stop - start, n_bins + 1).astype(int)[:-1]
+    ends = np.append(starts[1:], stop - start) - 1
+    lows = np.minimum.reduceat(curves, starts, axis=1)
+    highs = np.maximum.reduceat(curves, starts, axis=1)
+    decimated = np.stack([lows, highs], axis=2).reshape(len(curves), -1)
+    return decimated, np.stack([energy[starts], energy[ends]], axis=1).ravel()
+
+
+class SharedCurve:
+    """curve data and its QPainterPath, built once and drawn by one
+    SharedCurveItem in each plot (full range and bounded)"""
+
+    def __init__(self, curves, energy):
+        self.items = []
+        self.version = 0
+        self.set_data(curves, energy)
+
+    def set_data(self, curves, energy):
+        self.energy = np.asarray(energy, dtype=float)
+        self.curves = np.asarray(curves, dtype=float).reshape(-1, len(self.energy))
+        self.path = None
+        self.version += 1
+        finite_x = self.curves[np.isfinite(self.curves)]
+        finite_y = self.energy[np.isfinite(self.energy)]
+        if len(finite_x) and len(finite_y):
+            self.bounds = (finite_x.min(), finite_x.max(), finite_y.min(), finite_y.max())
+        else:
+            self.bounds = (0.0, 0.0, 0.0, 0.0)
+        for item in self.items:
+            item.prepareGeometryChange()
+            item.informViewBoundsChanged()
+            item.update()
+
+    def get_path(self):
+        if self.path is None:
+            with TRACE.span('curve path', curves=len(self.curves)):
+                self.path = pg.arrayToQPath(*pack_curves(self.curves, self.energy))
+        return self.path
+
+    def decimated_path(self, low, high, n_bins):
+        """path of the curves in the energy window [low, high], see minmax_decimate"""
+        with TRACE.span('curve decimate', curves=len(self.curves), bins=n_bins):
+            return pg.arrayToQPath(*pack_curves(*minmax_decimate(self.curves, self.energy, low, high, n_bins)))
+
+    def item(self, pen, lod=False):
+        """new item drawing this curve, to be added to a plot"""
+        item = SharedCurveItem(self, pen, lod)
+        self.items.append(item)
+        return item
+
+
+class SharedCurveItem(pg.GraphicsObject):
+    """draws the path of a SharedCurve; several items can share one curve
+
+    with lod=True the item draws only the energy window visible in its view,
+    min/max decimated to one bin per pixel of height; the path is rebuilt when
+    the view range, the view height or the data change
+    """
+
+    def __init__(self, curve, pen, lod=False):
+        super().__init__()
+        self.curve = curve
+        self.pen = pg.mkPen(pen)
+        self.lod = lod
+        self.lod_key = None
+        self.lod_path = None
+
+    def boundingRect(self):
+        xmin, xmax, ymin, ymax = self.curve.bounds
+        return QtCore.QRectF(xmin, ymin, xmax - xmin, ymax - ymin)
+
+    def dataBounds(self, ax, frac=1.0, orthoRange=None):
+        return self.curve.bounds[2 * ax:2 * ax + 2]
+
+    def paint(self, painter, *args):
+        with TRACE.span('curve paint'):
+            painter.setRenderHint(QtGui.QPainter.Antialiasing, pg.getConfigOption('antialias'))
+            painter.setPen(self.pen)
+            painter.drawPath(self.get_path())
+
+    def get_path(self):
+        view = self.getViewBox() if self.lod else None
+        if view is None or len(self.curve.energy) <= 2 * view.height():
+            return self.curve.get_path()
+        low, high = view.viewRange()[1]
+        key = (low, high, max(int(view.height()), 1), self.curve.version)
+        if key != self.lod_key:
+            self.lod_key = key
+            self.lod_path = self.curve.decimated_path(*key[:3])
+        return self.lod_path
+
+
+def add_shared(plots, curves, energy, pen, lod=False):
+    """show the curves in every plot through one SharedCurve; returns the curve"""
+    curve = SharedCurve(curves, energy)
+    for plot in plots:
+        plot.addItem(curve.item(pen, lod))
+    return curve
+
+
+def group_by_color(orbitals, colors):
+    """{color: [orbital indices]} for the selected orbitals, keeping their order"""
+    groups = {}
+    for orbital in orbitals:
+        groups.setdefault(colors[orbital % len(colors)], []).append(orbital)
+    return groups
+
+
+class RedrawScheduler(QtCore.QObject):
+    """collapses bursts of requests into one call of ``callback`` per frame
+
+    request() can be connected directly to Qt signals; the callback runs once,
+    ``interval`` ms after the first request of a burst
+    """
+
+    def __init__(self, callback, interval=16, parent=None):
+        super().__init__(parent)
+        self.callback = callback
+        self.timer = QtCore.QTimer(self)
+        self.timer.setSingleShot(True)
+        self.timer.setInterval(interval)
+        self.timer.timeout.connect(self.callback)
+
+    def request(self, *args):
+        if not self.timer.isActive():
+            self.timer.start()
+
+    def flush(self):
+        """run a pending callback now"""
+        if self.timer.isActive():
+            self.timer.stop()
+            self.callback()
@@ -0,0 +1,98 @@
+import json
+import os
+import numpy as np
+from file_keys import content_hash, file_key
+
+CACHE_VERSION = 1
+
+
+def cache_dir(filename):
+    """sidecar directory holding the binary cache of a DOSCAR"""
+    return filename + '.cache'
+
+
+def load(filename):
+    """return cached DOSCAR data as a dict, or None if the cache is missing or stale
+
+    the projected DOS is opened with np.memmap, so only the pages that are
+    actually plotted get read from disk
+    """
+    directory = cache_dir(filename)
+    try:
+        with open(os.path.join(directory, 'meta.json'), 'r') as file:
+            meta = json.load(file)
+    except (OSError, ValueError):
+        return None
+    if meta.get('version') != CACHE_VERSION:
+        return None
+    stat = os.stat(filename)
+    key = meta.get('key', {})
+    if key.get('size') != stat.st_size or key.get('mtime_ns') != stat.st_mtime_ns:
+        return None
+    if key.get('hash') != content_hash(filename, stat.st_size):
+        return None
+    try:
+        dos = np.load(os.path.join(directory, 'pdos.npy'), mmap_mode='r')
+        total_dos = np.load(os.path.join(directory, 'total.npy'))
+    except (OSError, ValueError):
+        return None
+    if list(dos.shape) != meta['shape']:
+        return None
+    meta['dos'] = dos
+    meta['total_dos'] = total_dos
+    return meta
+
+
+def create(filename, shape):
+    """start a new cache and return its projected DOS array opened for writing, so
+    it can be filled in place (also by other processes); finish it with save()"""
+    directory = cache_dir(filename)
+    os.makedirs(directory, exist_ok=True)
+    for name in ('meta.json', 'pdos.npy'):
+        path = os.path.join(directory, name)
+        if os.path.exists(path):
+            os.remove(path)
+    return np.lib.format.open_memmap(os.path.join(directory, 'pdos.npy'), mode='w+', dtype=float, shape=shape)
+
+
+def save(filename, doscar, dos=None):
+    """write the parsed data of a DOSCARparser next to the DOSCAR file; ``dos``
+    replaces doscar.dos, e.g. the array of create() filled from a lazy parser
+
+    meta.json is written last, so an interrupted write leaves a cache that
+    load() treats as stale; returns False if the directory is not writable
+    """
+    directory = cache_dir(filename)
+    dos = doscar.dos if dos is None else dos
+    meta = {
+        'version': CACHE_VERSION,
+        'key': file_key(filename),
+        'shape': list(dos.shape),
+        'number_of_atoms': doscar.number_of_atoms,
+        'emax': doscar.emax,
+        'emin': doscar.emin,
+        'nedos': doscar.nedos,
+        'efermi': doscar.efermi,
+        'n_columns': doscar.n_columns,
+    }
+    try:
+        os.makedirs(directory, exist_ok=True)
+        meta_path = os.path.join(directory, 'meta.json')
+        if os.path.exists(meta_path):
+            os.remove(meta_path)
+        for name, data in (('pdos.npy', dos), ('total.npy', doscar.total_dos)):
+            path = os.path.join(directory, name)
+            if isinstance(data, np.memmap) and data.filename == os.path.abspath(path):
+                data.flush()  # filled in place, see create()
+                continue
+            tmp_path = os.path.join(directory, name + '.tmp')
+            with open(tmp_path, 'wb') as file:
+                np.save(file, data)
+            os.replace(tmp_path, path)
+        with open(meta_path + '.tmp', 'w') as file:
+            json.dump(meta, file)
+        os.replace(meta_path + '.tmp', meta_path)
+    except OSError as error:
+        print(f'could not write DOSCAR cache in {directory}: {error}')
+        return False
+    return True
@@ -0,0 +1,32 @@
+"""keys telling whether a file changed since a sidecar (DOSCAR cache, OUTCAR
+index) was written next to it"""
+import hashlib
+import os
+
+SAMPLE_SIZE = 1 << 16
+SAMPLE_COUNT = 16
+
+
+def content_hash(filename, size):
+    """hash of the file head, tail and evenly spaced samples in between
+
+    reading the whole file would cost as much as parsing it, so only
+    SAMPLE_COUNT blocks of SAMPLE_SIZE bytes are hashed together with the size
+    """
+    digest = hashlib.blake2b(str(size).encode(), digest_size=16)
+    with open(filename, 'rb') as file:
+        if size <= SAMPLE_SIZE * (SAMPLE_COUNT + 2):
+            digest.update(file.read())
+        else:
+            step = (size - SAMPLE_SIZE) // (SAMPLE_COUNT + 1)
+            for i in range(SAMPLE_COUNT + 2):
+                file.seek(min(i * step, size - SAMPLE_SIZE))
+                digest.update(file.read(SAMPLE_SIZE))
+    return digest.hexdigest()
+
+
+def file_key(filename):
+    """size, mtime and content hash identifying the state of a file"""
+    stat = os.stat(filename)
+    return {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns,
+            'hash': content_hash(filename, stat.st_size)}
@@ -0,0 +1,65 @@
+import itertools
+import numpy as np
+
+
+def frac_to_cart(frac, lattice):
+    """convert fractional (Direct) coordinates to Cartesian
+
+    rows of ``lattice`` are the cell vectors, as in POSCAR. ``frac`` may be (3,),
+    (N, 3) or a whole trajectory (T, N, 3); a (T, 3, 3) lattice gives one cell per frame
+    """
+    return np.matmul(np.asarray(frac, dtype=float), np.asarray(lattice, dtype=float))
+
+
+def cart_to_frac(cart, lattice):
+    """convert Cartesian coordinates to fractional, inverse of frac_to_cart"""
+    return np.matmul(np.asarray(cart, dtype=float), np.linalg.inv(np.asarray(lattice, dtype=float)))
+
+
+def wrap_frac(frac):
+    """wrap fractional coordinates into [0, 1)"""
+    wrapped = np.asarray(frac, dtype=float) % 1.0
+    wrapped[wrapped >= 1.0] = 0.0  # -1e-17 % 1.0 == 1.0
+    return wrapped
+
+
+def wrap_cart(cart, lattice):
+    """wrap Cartesian coordinates into the unit cell"""
+    return frac_to_cart(wrap_frac(cart_to_frac(cart, lattice)), lattice)
+
+
+def minimum_image(displacement, lattice):
+    """shortest periodic image of Cartesian displacement vectors (..., 3)
+
+    the fractional displacement is rounded first and the images around it are
+    searched as far as the cell shape requires, so skewed cells are exact too.
+    the shifts are tried one at a time against a running minimum, so memory
+    stays at a few copies of the input however many shifts a skewed cell needs
+    """
+    lattice = np.asarray(lattice, dtype=float)
+    frac = cart_to_frac(displacement, lattice)
+    frac -= np.round(frac)
+    shape = frac.shape
+    if lattice.ndim == 3:  # one cell per frame, shifts get a point axis
+        frac = frac.reshape(lattice.shape[0], -1, 3)
+        cell = lattice[:, None, :, :]
+    else:
+        frac = frac.reshape(-1, 3)
+        cell = lattice
+    rounded = frac_to_cart(frac, lattice)
+    best = rounded.copy()
+    best_sq = np.einsum('...i,...i->...', best, best)
+    # an image shorter than the rounded one lies within ``reach`` of the origin,
+    # i.e. at most reach * |column of inv(lattice)| cells away along each axis
+    reach = np.sqrt(best_sq.max(initial=0.0))
+    recip = np.linalg.norm(np.linalg.inv(lattice).reshape(-1, 3, 3), axis=-2).max(axis=0)
+    n = np.floor(reach * recip + 0.5).astype(int)
+    for shift in itertools.product(*[range(-k, k + 1) for k in n]):
+        if not any(shift):
+            continue
+        candidate = rounded + frac_to_cart(np.array(shift, dtype=float), cell)
+        candidate_sq = np.einsum('...i,...i->...', candidate, candidate)
+        closer = candidate_sq < best_sq
+        best[closer] = candidate[closer]
+        best_sq[closer] = candidate_sq[closer]
+    return best.reshape(shape)
@@ -0,0 +1,166 @@
+"""timed spans, counters and optional cProfile capture
+
+    from instrumentation import TRACE, timed
+
+    with TRACE.span('doscar.atom blocks', atoms=n):
+        ...
+
+    @timed('update_plot')
+    def update_plot(self):
+        ...
+
+    TRACE.count('curves drawn', 384)
+
+the last ``max_spans`` spans are kept in a ring buffer and summarised per name;
+export_trace writes them with the counter samples in the Chrome trace event
+format, which chrome://tracing and ui.perfetto.dev open. nothing here imports
+Qt, so the parsers can use it from the loader thread. spans opened in worker
+processes (parallel DOSCAR parse, batch CLI) stay in those processes
+"""
+import functools
+import json
+import os
+import threading
+import time
+from collections import deque, namedtuple
+from contextlib import contextmanager
+import numpy as np
+
+Span = namedtuple('Span', ['name', 'start', 'duration', 'thread', 'args'])
+Sample = namedtuple('Sample', ['name', 'time', 'value'])
+
+SUMMARY_FIELDS = [('name', 'U40'), ('calls', int), ('total_ms', float), ('mean_ms', float), ('max_ms', float),
+                  ('last_ms', float)]
+
+
+class Instrumentation:
+    """spans and counters of one process; times are seconds since ``origin``"""
+
+    def __init__(self, max_spans=10000):
+        self.enabled = True
+        self.origin = time.perf_counter()
+        self.spans = deque(maxlen=max_spans)
+        self.samples = deque(maxlen=max_spans)
+        self.counters = {}
+        self.thread_names = {}
+        self.profiler = None
+
+    @contextmanager
+    def span(self, name, **args):
+        """time the body of a with block; keyword arguments are stored with it"""
+        if not self.enabled:
+            yield
+            return
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            thread = threading.current_thread()
+            self.thread_names[thread.ident] = thread.name
+            # deque.append is atomic, spans may come from several threads
+            self.spans.append(Span(name, start - self.origin, time.perf_counter() - start, thread.ident, args))
+
+    def count(self, name, value):
+        """set counter ``name``, e.g. the number of curves drawn or bytes held"""
+        self.counters[name] = value
+        if self.enabled:
+            self.samples.append(Sample(name, time.perf_counter() - self.origin, value))
+
+    def add(self, name, delta=1):
+        self.count(name, self.counters.get(name, 0) + delta)
+
+    def clear(self):
+        self.spans.clear()
+        self.samples.clear()
+
+    def summary(self):
+        """structured array, one row per span name: calls, total, mean, max and
+        last duration in ms over the spans still in the buffer"""
+        rows = {}
+        for span in list(self.spans):
+            calls, total, longest, _ = rows.get(span.name, (0, 0.0, 0.0, 0.0))
+            rows[span.name] = (calls + 1, total + span.duration, max(longest, span.duration), span.duration)
+        table = np.zeros(len(rows), dtype=SUMMARY_FIELDS)
+        for row, (name, (calls, total, longest, last)) in zip(table, sorted(rows.items())):
+            row['name'], row['calls'] = name, calls
+            row['total_ms'], row['mean_ms'] = 1000 * total, 1000 * total / calls
+            row['max_ms'], row['last_ms'] = 1000 * longest, 1000 * last
+        return table
+
+    def export_trace(self, filename):
+        """write spans and counter samples as Chrome trace events (JSON)"""
+        pid = os.getpid()
+        events = [{'name': 'thread_name', 'ph': 'M', 'pid': pid, 'tid': ident, 'args': {'name': name}}
+                  for ident, name in self.thread_names.items()]
+        for span in list(self.spans):
+            events.append({'name': span.name, 'ph': 'X', 'pid': pid, 'tid': span.thread, 'ts': 1e6 * span.start,
+                           'dur': 1e6 * span.duration, 'args': {key: str(value) for key, value in span.args.items()}})
+        for sample in list(self.samples):
+            events.append({'name': sample.name, 'ph': 'C', 'pid': pid, 'ts': 1e6 * sample.time,
+                           'args': {sample.name: sample.value}})
+        with open(filename, 'w') as file:
+            json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, file)
+
+    @property
+    def profiling(self):
+        return self.profiler is not None
+
+    def start_profile(self):
+        """start cProfile in the calling thread (for the GUI: the main thread)"""
+        if self.profiler is None:
+            import cProfile  # profiling is rare, keep it out of the startup imports
+            self.profiler = cProfile.Profile()
+            self.profiler.enable()
+
+    def stop_profile(self, filename=None, top=20):
+        """stop cProfile and return (text, error): the ``top`` entries by cumulative
+        time as text, and the OSError if writing the stats to ``filename`` (.prof,
+        for pstats or snakeviz) failed, else None; the text is returned either way"""
+        if self.profiler is None:
+            return '', None
+        import io
+        import pstats
+        profiler, self.profiler = self.profiler, None
+        profiler.disable()
+        error = None
+        if filename:
+            try:
+                profiler.dump_stats(filename)
+            except OSError as exc:
+                error = exc
+        text = io.StringIO()
+        pstats.Stats(profiler, stream=text).sort_stats('cumulative').print_stats(top)
+        return text.getvalue(), error
+
+
+def held_bytes(value):
+    """bytes of the NumPy arrays in value: an array (memmaps count their mapped
+    size), a dict or list of them, or a per-atom store with a ``resident`` cache"""
+    if isinstance(value, np.ndarray):
+        return value.nbytes
+    if isinstance(value, dict):
+        return sum(held_bytes(item) for item in value.values())
+    if isinstance(value, (list, tuple)):
+        return sum(held_bytes(item) for item in value)
+    if hasattr(value, 'resident'):
+        return held_bytes(value.resident)
+    return 0
+
+
+TRACE = Instrumentation()
+
+
+def timed(name=None):
+    """decorator running the function inside TRACE.span(name or its qualified name)
+
+    the wrapper takes any arguments, so it must not wrap a slot connected to a
+    signal that sends arguments (e.g. clicked): PyQt would pass them on"""
+    def decorate(func):
+        label = name or func.__qualname__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with TRACE.span(label):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorate
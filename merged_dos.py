@@ -0,0 +1,102 @@
+import numpy as np
+from instrumentation import timed
+
+# atoms summed per fancy-indexing step, bounds the temporary copy of the selection
+ATOM_BATCH = 64
+
+
+def take_atoms(dos, atoms, orbitals):
+    """(atoms, orbitals, n_spin, nedos) slice of a DOS array or of LazyAtomBlocks"""
+    if isinstance(dos, np.ndarray):
+        return dos[atoms[:, None], orbitals[None, :]]
+    return np.stack([dos[atom][orbitals] for atom in atoms])
+
+
+@timed('merge_sum')
+def merge_sum(dos, atoms, orbitals, weights=None):
+    """(n_spin, nedos) sum of the projected DOS over the selected atoms and orbitals
+
+    dos is DOSCARparser.dos, an (n_atoms, n_orbitals, n_spin, nedos) array or
+    LazyAtomBlocks; weights are optional per-atom factors (e.g. occupancy), one
+    per selected atom
+    """
+    atoms = np.asarray(atoms, dtype=int).ravel()
+    orbitals = np.asarray(orbitals, dtype=int).ravel()
+    total = np.zeros(dos[0].shape[1:], dtype=float)
+    if len(atoms) == 0 or len(orbitals) == 0:
+        return total
+    if weights is None:
+        weights = np.ones(len(atoms), dtype=float)
+    else:
+        weights = np.asarray(weights, dtype=float).ravel()
+        if len(weights) != len(atoms):
+            raise ValueError(f'{len(weights)} weights given for {len(atoms)} atoms')
+    for start in range(0, len(atoms), ATOM_BATCH):
+        batch = take_atoms(dos, atoms[start:start + ATOM_BATCH], orbitals)
+        total += np.einsum('a,aosn->sn', weights[start:start + ATOM_BATCH], batch)
+    return total
+
+
+def merge_pdos(dos, atoms, orbitals, weights=None):
+    """sum the projected DOS of the selected atoms and orbitals, see merge_sum;
+    returns the summed spin up and spin down arrays over energy (down is None for ISPIN=1)"""
+    total = merge_sum(dos, atoms, orbitals, weights)
+    return total[0], total[1] if len(total) > 1 else None
+
+
+class SelectionAccumulator:
+    """running spin up / down sums of the projected DOS over an atom x orbital selection
+
+    update() compares the new selection masks with the current ones and only adds
+    or subtracts the contribution of the atoms and orbitals that changed, so one
+    toggle costs O(n_selected x nedos) instead of a full re-sum
+    """
+
+    def __init__(self, dos):
+        self.dos = dos
+        n_orbitals, n_spin, nedos = dos[0].shape
+        self.atom_mask = np.zeros(len(dos), dtype=bool)
+        self.orbital_mask = np.zeros(n_orbitals, dtype=bool)
+        self.total = np.zeros((n_spin, nedos), dtype=float)
+
+    @property
+    def up(self):
+        return self.total[0]
+
+    @property
+    def down(self):
+        return self.total[1] if len(self.total) > 1 else None
+
+    @timed('selection update')
+    def update(self, atom_mask=None, orbital_mask=None):
+        """apply a new selection as one batched delta; returns True if it changed"""
+        changed = False
+        if orbital_mask is not None:
+            orbital_mask = np.asarray(orbital_mask, dtype=bool)
+            added = np.flatnonzero(orbital_mask & ~self.orbital_mask)
+            removed = np.flatnonzero(self.orbital_mask & ~orbital_mask)
+            atoms = np.flatnonzero(self.atom_mask)
+            self.apply(atoms, added, atoms, removed)
+            self.orbital_mask = orbital_mask.copy()
+            changed |= len(added) + len(removed) > 0
+        if atom_mask is not None:
+            atom_mask = np.asarray(atom_mask, dtype=bool)
+            added = np.flatnonzero(atom_mask & ~self.atom_mask)
+            removed = np.flatnonzero(self.atom_mask & ~atom_mask)
+            orbitals = np.flatnonzero(self.orbital_mask)
+            self.apply(added, orbitals, removed, orbitals)
+            self.atom_mask = atom_mask.copy()
+            changed |= len(added) + len(removed) > 0
+        if not self.atom_mask.any() or not self.orbital_mask.any():
+            self.total[:] = 0.0  # drop rounding left over from the deltas
+        return changed
+
+    def apply(self, added_atoms, added_orbitals, removed_atoms, removed_orbitals):
+        if len(added_atoms) and len(added_orbitals):
+            self.total += merge_sum(self.dos, added_atoms, added_orbitals)
+        if len(removed_atoms) and len(removed_orbitals):
+            self.total -= merge_sum(self.dos, removed_atoms, removed_orbitals)
+
+    def recompute(self):
+        """sum the current selection from scratch"""
+        self.total = merge_sum(self.dos, np.flatnonzero(self.atom_mask), np.flatnonzero(self.orbital_mask))
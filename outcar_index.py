@@ -0,0 +1,164 @@
+import mmap
+import os
+from itertools import islice
+import numpy as np
+from file_keys import file_key
+from VASPparser import IonicStep, read_magnetization_table, read_nions
+
+INDEX_VERSION = 2
+POSITION_TAG = b'POSITION'
+ENERGY_TAG = b'FREE ENERGIE'
+MAGNETIZATION_TAG = b'magnetization (x)'
+
+
+def index_path(filename):
+    return filename + '.index.npz'
+
+
+def find_line_starts(data, tag, progress=None):
+    """offsets of the lines of ``data`` (bytes or mmap) whose first word starts with
+    ``tag``; progress(position, len(data)) is called at every match"""
+    offsets = []
+    position = data.find(tag)
+    while position != -1:
+        if progress is not None:
+            progress(position, len(data))
+        line_start = data.rfind(b'\n', 0, position) + 1
+        if not data[line_start:position].strip():
+            offsets.append(line_start)
+        position = data.find(tag, position + len(tag))
+    return np.array(offsets, dtype=np.int64)
+
+
+def build_index(filename, progress=None):
+    """byte offsets of every POSITION, FREE ENERGIE and magnetization (x) block,
+    found with a bytes search over an mmap of the file; the file is searched once
+    per tag, progress(done, total) counts the bytes of all three searches and an
+    exception raised from it stops the scan"""
+    tags = (POSITION_TAG, ENERGY_TAG, MAGNETIZATION_TAG)
+    with open(filename, 'rb') as file:
+        if os.fstat(file.fileno()).st_size == 0:
+            return tuple(np.zeros(0, dtype=np.int64) for _ in tags)
+        with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            offsets = []
+            for k, tag in enumerate(tags):
+                report = None if progress is None else \
+                    lambda done, total, k=k: progress(k * total + done, len(tags) * total)
+                offsets.append(find_line_starts(data, tag, report))
+            return tuple(offsets)
+
+
+class OutcarIndex:
+    """random access to the ionic steps of an OUTCAR
+
+    the block offsets are stored in OUTCAR.index.npz and rebuilt when the OUTCAR
+    changes; any step, slice or stride is then read with one seek per step.
+    progress(done, total) is called while the index is built, see build_index
+    """
+
+    def __init__(self, filename, atom_count=None, persist=True, progress=None):
+        self.filename = filename
+        self.atom_count = atom_count if atom_count is not None else read_nions(filename)
+        if not (persist and self.load()):
+            self.position_offsets, self.energy_offsets, self.magnetization_offsets = build_index(filename, progress)
+            if persist:
+                self.save()
+        # energy block belonging to each position block: the first one after it,
+        # as long as it comes before the next position block
+        following = np.searchsorted(self.energy_offsets, self.position_offsets)
+        next_position = np.append(self.position_offsets[1:], np.iinfo(np.int64).max)
+        valid = following < len(self.energy_offsets)
+        valid[valid] &= self.energy_offsets[following[valid]] < next_position[valid]
+        self.step_energy = np.where(valid, following, -1)
+
+    def load(self):
+        try:
+            with np.load(index_path(self.filename)) as stored:
+                if int(stored['version']) != INDEX_VERSION:
+                    return False
+                if str(stored['key']) != repr(file_key(self.filename)):
+                    return False
+                self.position_offsets = stored['position_offsets']
+                self.energy_offsets = stored['energy_offsets']
+                self.magnetization_offsets = stored['magnetization_offsets']
+        except (OSError, ValueError, KeyError):
+            return False
+        return True
+
+    def save(self):
+        try:
+            with open(index_path(self.filename), 'wb') as file:
+                np.savez(file, version=INDEX_VERSION, key=repr(file_key(self.filename)),
+                         position_offsets=self.position_offsets, energy_offsets=self.energy_offsets,
+                         magnetization_offsets=self.magnetization_offsets)
+        except OSError as error:
+            print(f'could not write OUTCAR index: {error}')
+
+    def __len__(self):
+        return len(self.position_offsets)
+
+    def steps(self, key):
+        """step numbers selected by an int, slice or sequence of ints"""
+        if isinstance(key, slice):
+            return range(len(self))[key]
+        if np.ndim(key) == 0:
+            return [range(len(self))[key]]
+        return [range(len(self))[i] for i in key]
+
+    def read_positions(self, file, step):
+        file.seek(self.position_offsets[step])
+        file.readline()
+        file.readline()  # dashes
+        block = np.loadtxt([line.decode() for line in islice(file, self.atom_count)], usecols=range(6), ndmin=2)
+        return block[:, :3], block[:, 3:6]
+
+    def read_energy(self, file, step):
+        if self.step_energy[step] < 0:
+            return np.nan
+        file.seek(self.energy_offsets[self.step_energy[step]])
+        file.readline()
+        file.readline()
+        return float(file.readline().split()[4])
+
+    def __getitem__(self, key):
+        """IonicStep for an int, list of IonicSteps for a slice or sequence"""
+        steps = self.steps(key)
+        result = []
+        with open(self.filename, 'rb') as file:
+            for step in steps:
+                positions, forces = self.read_positions(file, step)
+                result.append(IonicStep(positions, forces, self.read_energy(file, step)))
+        return result[0] if np.ndim(key) == 0 and not isinstance(key, slice) else result
+
+    def positions(self, key=slice(None), out=None):
+        """positions of the selected steps as an (n, N, 3) array, written into ``out`` if given"""
+        steps = self.steps(key)
+        if out is None:
+            out = np.empty((len(steps), self.atom_count, 3), dtype=float)
+        with open(self.filename, 'rb') as file:
+            for i, step in enumerate(steps):
+                out[i] = self.read_positions(file, step)[0]
+        return out
+
+    def energies(self, key=slice(None)):
+        steps = self.steps(key)
+        with open(self.filename, 'rb') as file:
+            return np.array([self.read_energy(file, step) for step in steps], dtype=float)
+
+    def magnetization(self, key=slice(None)):
+        """moments of the selected magnetization tables (normally one per ionic step)
+        as an (n, N, columns) array; column names go to magnetization_columns"""
+        tables = range(len(self.magnetization_offsets))
+        tables = tables[key] if isinstance(key, slice) else [tables[i] for i in np.atleast_1d(key)]
+        result = []
+        with open(self.filename, 'rb') as file:
+            for table in tables:
+                file.seek(self.magnetization_offsets[table])
+                parsed = read_magnetization_table(file, self.atom_count)
+                if parsed is None:
+                    raise ValueError(f'incomplete magnetization table {table} in {self.filename}')
+                self.magnetization_columns, values = parsed
+                result.append(values)
+        if not result:
+            return np.zeros((0, self.atom_count, 0))
+        return np.stack(result)
@@ -0,0 +1,42 @@
+import numpy as np
+from PyQt5 import QtCore
+
+
+class RecordTableModel(QtCore.QAbstractTableModel):
+    """read-only table over a NumPy structured array, one column per field
+
+    cells are formatted only when the view asks for them; the raw value is
+    returned for QtCore.Qt.UserRole, which a QSortFilterProxyModel can sort on
+    """
+
+    def __init__(self, records=None, parent=None):
+        super().__init__(parent)
+        self.records = np.zeros(0, dtype=[('', float)]) if records is None else records
+
+    def set_records(self, records):
+        self.beginResetModel()
+        self.records = records
+        self.endResetModel()
+
+    def rowCount(self, parent=QtCore.QModelIndex()):
+        return 0 if parent.isValid() else len(self.records)
+
+    def columnCount(self, parent=QtCore.QModelIndex()):
+        return 0 if parent.isValid() else len(self.records.dtype.names)
+
+    def data(self, index, role=QtCore.Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        value = self.records[index.row()][index.column()]
+        if role == QtCore.Qt.DisplayRole:
+            return f'{value:.4f}' if isinstance(value, np.floating) else str(value)
+        if role == QtCore.Qt.UserRole:
+            return value.item()
+        return None
+
+    def headerData(self, section, orientation, role=QtCore.Qt.DisplayRole):
+        if role != QtCore.Qt.DisplayRole:
+            return None
+        if orientation == QtCore.Qt.Horizontal:
+            return self.records.dtype.names[section]
+        return str(section + 1)
@@ -0,0 +1,108 @@
+"""startup time of DOSwizard_main, to catch import regressions
+
+    python startup_report.py                  # top imports and time to a shown window
+    python startup_report.py --budget-ms 400  # exit code 1 when startup takes longer
+    python startup_report.py --json startup.json
+
+every measurement runs in a fresh interpreter: ``-X importtime`` for the
+import tree and an offscreen QApplication for the time until the main window
+is shown (data loading runs in the background and is not included)
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+SHOW_WINDOW = """
+import time
+start = time.perf_counter()
+import DOSwizard_main
+from PyQt5.QtWidgets import QApplication
+imported = time.perf_counter()
+app = QApplication([])
+window = DOSwizard_main.MainWindow({directory!r})
+window.show()
+app.processEvents()
+shown = time.perf_counter()
+print(1000 * (imported - start), 1000 * (shown - start))
+window.close()
+"""
+
+
+def run_python(args):
+    env = dict(os.environ, QT_QPA_PLATFORM='offscreen')
+    return subprocess.run([sys.executable] + args, cwd=HERE, env=env, capture_output=True, text=True, check=True)
+
+
+def import_times(module='DOSwizard_main'):
+    """[(module, self us, cumulative us, depth)] from ``python -X importtime``"""
+    stderr = run_python(['-X', 'importtime', '-c', f'import {module}']).stderr
+    times = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        own, cumulative, name = line[len('import time:'):].split('|')
+        depth = (len(name) - len(name.lstrip())) // 2
+        times.append((name.strip(), int(own), int(cumulative), depth))
+    return times
+
+
+def window_times(directory):
+    """(import ms, shown ms) for an offscreen MainWindow"""
+    stdout = run_python(['-c', SHOW_WINDOW.format(directory=directory)]).stdout
+    imported, shown = stdout.split()[-2:]
+    return float(imported), float(shown)
+
+
+def direct_imports(times):
+    """entries imported directly by the last top-level module, the module itself first"""
+    entries = [times[-1]]
+    for entry in reversed(times[:-1]):
+        if entry[3] == 0:
+            break
+        if entry[3] == 1:
+            entries.append(entry)
+    return entries
+
+
+def report(repeat=3, directory=HERE, top=15):
+    """best of ``repeat`` runs; DOSwizard_main and its direct imports by cumulative time"""
+    imports = min((import_times() for _ in range(repeat)), key=lambda times: times[-1][2])
+    windows = [window_times(directory) for _ in range(repeat)]
+    packages = sorted(direct_imports(imports), key=lambda entry: -entry[2])
+    return {'python': sys.version.split()[0],
+            'import_ms': imports[-1][2] / 1000,
+            'window_import_ms': min(imported for imported, _ in windows),
+            'shown_ms': min(shown for _, shown in windows),
+            'top_imports': [{'module': name, 'self_ms': own / 1000, 'cumulative_ms': cumulative / 1000}
+                            for name, own, cumulative, _ in packages[:top]]}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='measure the startup time of DOSwizard_main')
+    parser.add_argument('-n', '--repeat', type=int, default=3, help='runs per measurement, the best is kept')
+    parser.add_argument('-d', '--directory', default=HERE, help='directory passed to MainWindow')
+    parser.add_argument('--top', type=int, default=15, help='number of imports listed')
+    parser.add_argument('--budget-ms', type=float, help='fail when the window takes longer to show')
+    parser.add_argument('--json', help='also write the report to this file')
+    args = parser.parse_args(argv)
+
+    result = report(args.repeat, args.directory, args.top)
+    print(f'{"module":40s} {"self ms":>9s} {"cumul. ms":>9s}')
+    for entry in result['top_imports']:
+        print(f'{entry["module"]:40s} {entry["self_ms"]:9.1f} {entry["cumulative_ms"]:9.1f}')
+    print(f'\nimport DOSwizard_main {result["import_ms"]:.0f} ms, window shown after {result["shown_ms"]:.0f} ms')
+    if args.json:
+        with open(args.json, 'w') as file:
+            json.dump(result, file, indent=1)
+    if args.budget_ms is not None and result['shown_ms'] > args.budget_ms:
+        print(f'over budget: {result["shown_ms"]:.0f} > {args.budget_ms:.0f} ms', file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
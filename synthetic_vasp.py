@@ -0,0 +1,131 @@
+"""synthetic DOSCAR / POSCAR / OUTCAR files of any size, for benchmarks
+
+    python synthetic_vasp.py bench_run --atoms 256 --nedos 3000 --layout f
+
+the projected DOS is a few gaussian peaks per orbital, scaled a little per
+atom, so curves look like real ones without being identical. layouts are the
+per-atom column sets of VASP: s, p, d, f give 2, 8, 18, 32 projected columns
+with spin=2 (spin up / down alternating) and half of that with spin=1
+"""
+import argparse
+import os
+import numpy as np
+
+LAYOUT_ORBITALS = {'s': 1, 'p': 4, 'd': 9, 'f': 16}
+SPECIES = ('Ce', 'O')
+EMIN, EMAX, EFERMI = -30.0, 15.0, 5.5
+
+
+def projected_columns(layout, spin=2):
+    """number of projected columns per atom block, e.g. 18 for d with spin=2"""
+    if layout not in LAYOUT_ORBITALS:
+        raise ValueError(f'unknown layout {layout!r}, use one of {", ".join(LAYOUT_ORBITALS)}')
+    if spin not in (1, 2):
+        raise ValueError('spin must be 1 or 2')
+    return LAYOUT_ORBITALS[layout] * spin
+
+
+def peaks(energy, n_curves, rng, n_peaks=4):
+    """(n_curves, nedos) sums of gaussian peaks inside the energy range"""
+    centres = rng.uniform(energy[0] + 5, energy[-1] - 2, (n_curves, n_peaks, 1))
+    widths = rng.uniform(0.3, 2.0, (n_curves, n_peaks, 1))
+    heights = rng.uniform(0.0, 0.5, (n_curves, n_peaks, 1))
+    return (heights * np.exp(-0.5 * ((energy - centres) / widths) ** 2)).sum(axis=1)
+
+
+def header_line(nedos, emin=EMIN, emax=EMAX, efermi=EFERMI):
+    return f'{emax:16.8f}{emin:16.8f}{nedos:5d}{efermi:16.8f}{1.0:16.8f}\n'
+
+
+def write_doscar(filename, n_atoms, nedos, layout='d', spin=2, seed=0):
+    """DOSCAR with a total DOS and one projected block per atom"""
+    rng = np.random.default_rng(seed)
+    n_columns = projected_columns(layout, spin)
+    energy = np.linspace(EMIN, EMAX, nedos)
+    step = energy[1] - energy[0]
+    shapes = peaks(energy, n_columns, rng)
+    total = peaks(energy, spin, rng) * n_atoms
+    # energy, DOS and integrated DOS per spin
+    total = np.column_stack([energy, total.T, np.cumsum(total, axis=1).T * step])
+    block_fmt = ['%11.3f'] + ['%12.4E'] * n_columns
+    with open(filename, 'w') as file:
+        file.write(f'{n_atoms:4d}{n_atoms:4d}   1   0\n')
+        file.write('  0.1383644E+02  0.5496276E-09  0.5496276E-09  0.5496276E-09  0.2500000E-15\n')
+        file.write('  1.000000000000000E-004\n  CAR \n synthetic\n')
+        file.write(header_line(nedos))
+        np.savetxt(file, total, fmt=['%11.3f'] + ['%12.4E'] * (total.shape[1] - 1))
+        for atom in range(n_atoms):
+            scale = rng.uniform(0.8, 1.2, (n_columns, 1))
+            file.write(header_line(nedos))
+            np.savetxt(file, np.column_stack([energy, (shapes * scale).T]), fmt=block_fmt)
+
+
+def write_poscar(filename, n_atoms, species=SPECIES, seed=0):
+    """cubic cell with the atoms split evenly over ``species``, direct coordinates"""
+    rng = np.random.default_rng(seed)
+    counts = [len(part) for part in np.array_split(np.arange(n_atoms), len(species))]
+    a = 3.0 * max(n_atoms, 1) ** (1 / 3)
+    with open(filename, 'w') as file:
+        file.write('synthetic\n   1.00000000000000\n')
+        for row in np.eye(3) * a:
+            file.write(''.join(f'{value:22.16f}' for value in row) + '\n')
+        file.write(''.join(f'{symbol:>5s}' for symbol in species) + '\n')
+        file.write(''.join(f'{count:6d}' for count in counts) + '\nDirect\n')
+        np.savetxt(file, rng.random((n_atoms, 3)), fmt='%20.16f')
+
+
+def write_outcar(filename, n_atoms, nedos=301, steps=10, layout='d', filler=200, seed=0):
+    """OUTCAR with ``steps`` ionic steps (positions, forces, free energy), each
+    padded with ``filler`` lines of other output, and a magnetization table"""
+    rng = np.random.default_rng(seed)
+    positions = rng.random((n_atoms, 3)) * 3.0 * max(n_atoms, 1) ** (1 / 3)
+    shells = 'spdf'[:'spdf'.index(layout) + 1]
+    dashes = ' ' + '-' * 83 + '\n'
+    with open(filename, 'w') as file:
+        file.write(f'   Dimension of arrays:\n     k-points           NKPTS =      1   k-points in BZ     NKDIM =      1\n'
+                   f'   number of dos      NEDOS = {nedos:6d}   number of ions     NIONS = {n_atoms:6d}\n\n')
+        file.write(' position of ions in cartesian coordinates  (Angst):\n')
+        np.savetxt(file, positions, fmt='%12.8f')
+        for step in range(steps):
+            file.writelines(f'      electronic step {step:4d} {line:6d}   0.1234E+00   -0.5678E-02\n'
+                            for line in range(filler))
+            forces = rng.normal(0, 0.05, (n_atoms, 3))
+            positions = positions + forces * 0.1
+            file.write(' POSITION                                       TOTAL-FORCE (eV/Angst)\n' + dashes)
+            np.savetxt(file, np.hstack([positions, forces]), fmt='%13.5f')
+            file.write(dashes + '    total drift:                                0.000 0.000 0.000\n\n')
+            file.write('  FREE ENERGIE OF THE ION-ELECTRON SYSTEM (eV)\n  ' + '-' * 51 + '\n')
+            file.write(f'  free  energy   TOTEN  = {-5.0 * n_atoms - step * 0.01:18.8f} eV\n\n')
+        moments = rng.normal(0, 0.1, (n_atoms, len(shells)))
+        file.write(' magnetization (x)\n\n# of ion   ' + ''.join(f'{shell:>8s}' for shell in shells)
+                   + '     tot\n' + '-' * 50 + '\n')
+        for atom, row in enumerate(moments, 1):
+            file.write(f'{atom:5d}      ' + ''.join(f'{value:8.3f}' for value in row) + f'{row.sum():8.3f}\n')
+        file.write('-' * 50 + '\ntot        ' + ''.join(f'{value:8.3f}' for value in moments.sum(axis=0))
+                   + f'{moments.sum():8.3f}\n')
+
+
+def write_run(directory, n_atoms, nedos, layout='d', spin=2, steps=10, seed=0):
+    """DOSCAR, POSCAR and OUTCAR of one synthetic calculation in ``directory``"""
+    os.makedirs(directory, exist_ok=True)
+    write_doscar(os.path.join(directory, 'DOSCAR'), n_atoms, nedos, layout, spin, seed)
+    write_poscar(os.path.join(directory, 'POSCAR'), n_atoms, seed=seed)
+    write_outcar(os.path.join(directory, 'OUTCAR'), n_atoms, nedos, steps, layout, seed=seed)
+    return directory
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='write a synthetic VASP run (DOSCAR, POSCAR, OUTCAR)')
+    parser.add_argument('directory')
+    parser.add_argument('-a', '--atoms', type=int, default=64)
+    parser.add_argument('-n', '--nedos', type=int, default=3000)
+    parser.add_argument('-l', '--layout', choices=list(LAYOUT_ORBITALS), default='d')
+    parser.add_argument('--spin', type=int, choices=(1, 2), default=2)
+    parser.add_argument('--steps', type=int, default=10, help='ionic steps in the OUTCAR')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args(argv)
+    write_run(args.directory, args.atoms, args.nedos, args.layout, args.spin, args.steps, args.seed)
+
+
+if __name__ == '__main__':
+    main()
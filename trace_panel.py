@@ -0,0 +1,101 @@
+import numpy as np
+from PyQt5 import QtCore
+from PyQt5.QtWidgets import (QDockWidget, QWidget, QVBoxLayout, QHBoxLayout, QPushButton, QTableView, QSplitter,
+                             QFileDialog)
+from instrumentation import TRACE
+from record_table import RecordTableModel
+
+COUNTER_FIELDS = [('counter', 'U40'), ('value', np.int64)]
+
+
+class TracePanel(QDockWidget):
+    """dockable view of instrumentation.TRACE: per-span timings and counters
+
+    the tables are refreshed every ``interval`` ms while the panel is visible
+    and something changed. Profile runs cProfile on the GUI thread until it is
+    pressed again, Export trace writes the spans as Chrome trace events
+    """
+
+    message = QtCore.pyqtSignal(str)
+
+    def __init__(self, parent=None, interval=500):
+        super().__init__("Instrumentation", parent)
+        self.setObjectName('instrumentation')
+        widget = QWidget()
+        layout = QVBoxLayout(widget)
+
+        buttons = QHBoxLayout()
+        self.profile_btn = QPushButton("Profile")
+        self.profile_btn.setCheckable(True)
+        self.profile_btn.toggled.connect(self.profile_toggled)
+        export_btn = QPushButton("Export trace...")
+        export_btn.clicked.connect(self.export_trace)
+        clear_btn = QPushButton("Clear")
+        clear_btn.clicked.connect(self.clear)
+        for button in (self.profile_btn, export_btn, clear_btn):
+            buttons.addWidget(button)
+        buttons.addStretch()
+        layout.addLayout(buttons)
+
+        splitter = QSplitter(QtCore.Qt.Horizontal)
+        self.span_model = RecordTableModel(parent=self)
+        self.counter_model = RecordTableModel(parent=self)
+        for model, stretch in ((self.span_model, 3), (self.counter_model, 1)):
+            proxy = QtCore.QSortFilterProxyModel(self)
+            proxy.setSourceModel(model)
+            proxy.setSortRole(QtCore.Qt.UserRole)
+            table = QTableView()
+            table.setModel(proxy)
+            table.setSortingEnabled(True)
+            splitter.addWidget(table)
+            splitter.setStretchFactor(splitter.count() - 1, stretch)
+        layout.addWidget(splitter)
+        self.setWidget(widget)
+
+        self.shown_state = None
+        self.timer = QtCore.QTimer(self)
+        self.timer.setInterval(interval)
+        self.timer.timeout.connect(self.refresh)
+        self.timer.start()
+
+    def refresh(self):
+        if not self.isVisible():
+            return
+        state = (TRACE.spans[-1] if TRACE.spans else None, tuple(TRACE.counters.items()))
+        if state == self.shown_state:
+            return
+        self.shown_state = state
+        self.span_model.set_records(TRACE.summary())
+        counters = np.zeros(len(TRACE.counters), dtype=COUNTER_FIELDS)
+        for row, (name, value) in zip(counters, sorted(TRACE.counters.items())):
+            row['counter'], row['value'] = name, value
+        self.counter_model.set_records(counters)
+
+    def clear(self):
+        TRACE.clear()
+        self.refresh()
+
+    def profile_toggled(self, checked):
+        if checked:
+            TRACE.start_profile()
+            self.message.emit('profiling, press Profile again to stop')
+            return
+        filename, _ = QFileDialog.getSaveFileName(self, "Save profile (cancel to only print it)", "",
+                                                  "cProfile stats (*.prof)")
+        text, error = TRACE.stop_profile(filename)
+        self.message.emit(text)
+        if error is not None:
+            self.message.emit(f'could not write profile: {error}')
+        elif filename:
+            self.message.emit(f'profile written to {filename}')
+
+    def export_trace(self):
+        filename, _ = QFileDialog.getSaveFileName(self, "Export trace", "", "Chrome trace (*.json)")
+        if not filename:
+            return
+        try:
+            TRACE.export_trace(filename)
+        except OSError as error:
+            self.message.emit(f'could not write trace: {error}')
+            return
+        self.message.emit(f'{len(TRACE.spans)} spans written to {filename} (open in chrome://tracing or ui.perfetto.dev)')